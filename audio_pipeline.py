@@ -0,0 +1,680 @@
+import sys
+import json
+import time
+import wave
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import numpy as np
+
+
+class VoiceActivityEndpointer:
+    """
+    Frame-level energy VAD that decides when a spoken command has ended.
+    Feed it 16 kHz int16 chunks; process() returns True once speech has been
+    followed by `hangover` seconds of silence, or a hard limit has been hit.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, energy_threshold=200,
+                 noise_ratio=3.0, hangover=0.3, min_duration=0.5, max_duration=8.0,
+                 no_speech_timeout=3.5, min_speech_frames=3):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.frame_duration = self.frame_len / sample_rate
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio # Speech must sit this far above the ambient floor
+        self.hangover = hangover
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.no_speech_timeout = no_speech_timeout
+        self.min_speech_frames = min_speech_frames # Debounce clicks/taps
+        self.reset()
+
+    def reset(self):
+        """Clear all state so the endpointer can be reused for the next command."""
+        self.frames_seen = 0
+        self.noise_floor = None
+        self.speech_run = 0
+        self.speech_start_time = None
+        self.last_speech_time = None
+        self.endpoint_time = None
+        self.reason = None
+        self._remainder = np.zeros(0, dtype=np.int16)
+
+    @property
+    def elapsed(self):
+        return self.frames_seen * self.frame_duration
+
+    @property
+    def speech_detected(self):
+        return self.speech_start_time is not None
+
+    def process(self, chunk):
+        """
+        Consume a chunk (bytes or int16 array). Returns True once the endpoint is reached.
+        """
+        if self.endpoint_time is not None:
+            return True
+
+        samples = chunk if isinstance(chunk, np.ndarray) else np.frombuffer(chunk, dtype=np.int16)
+        if self._remainder.size:
+            samples = np.concatenate((self._remainder, samples))
+
+        n_frames = samples.size // self.frame_len
+        usable = n_frames * self.frame_len
+        self._remainder = samples[usable:].copy()
+        if n_frames == 0:
+            return False
+
+        # Vectorized per-frame RMS over the whole chunk
+        frames = samples[:usable].reshape(n_frames, self.frame_len).astype(np.float32)
+        levels = np.sqrt(np.mean(frames * frames, axis=1))
+
+        for level in levels:
+            self.frames_seen += 1
+            now = self.elapsed
+
+            threshold = self.energy_threshold
+            if self.noise_floor is not None:
+                threshold = max(threshold, self.noise_floor * self.noise_ratio)
+
+            if level > threshold:
+                self.speech_run += 1
+                if self.speech_detected:
+                    self.last_speech_time = now
+                elif self.speech_run >= self.min_speech_frames:
+                    self.speech_start_time = now - self.speech_run * self.frame_duration
+                    self.last_speech_time = now
+            else:
+                self.speech_run = 0
+                # Track the ambient floor on non-speech frames only
+                if self.noise_floor is None:
+                    self.noise_floor = float(level)
+                else:
+                    self.noise_floor = 0.95 * self.noise_floor + 0.05 * float(level)
+
+            if self._check_endpoint(now):
+                return True
+
+        return False
+
+    def _check_endpoint(self, now):
+        if now >= self.max_duration:
+            self.reason = "max_duration"
+        elif not self.speech_detected and now >= self.no_speech_timeout:
+            self.reason = "no_speech"
+        elif self.speech_detected and now >= self.min_duration and (now - self.last_speech_time) >= self.hangover:
+            self.reason = "silence"
+        else:
+            return False
+
+        self.endpoint_time = now
+        return True
+
+
+class MicrophoneCapture:
+    """
+    Always-on microphone capture thread feeding a fixed-size int16 ring buffer.
+    The stream is opened once; readers follow the audio with absolute sample
+    cursors and get contiguous numpy views back (no copying), even across wrap-around.
+    Views stay valid until the writer laps them, so consume them promptly.
+    """
+
+    def __init__(self, pa, sample_rate=16000, chunk_frames=1600, capacity_seconds=10.0):
+        self.pa = pa
+        self.sample_rate = sample_rate
+        self.chunk_frames = chunk_frames
+        self.capacity = int(sample_rate * capacity_seconds)
+        # Mirrored storage: every sample is written at i and i + capacity, so any
+        # window up to `capacity` samples is a contiguous slice.
+        self._buffer = np.zeros(self.capacity * 2, dtype=np.int16)
+        self._write_pos = 0 # Absolute number of samples captured so far
+        self._cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.stream = None
+        self.overruns = 0 # Times a reader fell out of the ring and was skipped forward
+
+    def start(self):
+        if self.running:
+            return
+        self.stream = self.pa.open(
+            format=self.pa.get_format_from_width(2), channels=1, rate=self.sample_rate,
+            input=True, frames_per_buffer=self.chunk_frames,
+        )
+        self.stream.start_stream()
+        self.running = True
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2)
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+
+    def _run_loop(self):
+        while self.running:
+            try:
+                data = self.stream.read(self.chunk_frames, exception_on_overflow=False)
+            except Exception as e:
+                print(f"[jarvis] Microphone capture error: {e}")
+                time.sleep(0.1)
+                continue
+            if data:
+                self.write(np.frombuffer(data, dtype=np.int16))
+
+    def write(self, samples):
+        """Append samples to the ring and wake any waiting readers."""
+        n = samples.size
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        start = self._write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        for offset in (0, self.capacity):
+            self._buffer[offset + start:offset + start + first] = samples[:first]
+        if first < n:
+            rest = n - first
+            for offset in (0, self.capacity):
+                self._buffer[offset:offset + rest] = samples[first:]
+
+        with self._cond:
+            self._write_pos += samples.size
+            self._cond.notify_all()
+
+    def cursor(self, preroll=0.0):
+        """
+        Current absolute read position, optionally rewound by `preroll` seconds
+        (clamped to what the ring still holds).
+        """
+        with self._cond:
+            back = min(int(preroll * self.sample_rate), self._write_pos, self.capacity - self.chunk_frames)
+            return self._write_pos - max(back, 0)
+
+    def read(self, cursor, frames, timeout=2.0):
+        """
+        Block until `frames` samples past `cursor` are available.
+        Returns (view, next_cursor); view is empty on timeout or shutdown.
+        """
+        frames = min(frames, self.capacity - self.chunk_frames)
+        deadline = time.time() + timeout
+        with self._cond:
+            while self.running and self._write_pos < cursor + frames:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            available = self._write_pos
+
+        # Reader fell behind the writer by more than the ring holds: skip ahead
+        if available - cursor > self.capacity - self.chunk_frames:
+            self.overruns += 1
+            cursor = available - frames
+
+        n = max(0, min(frames, available - cursor))
+        start = cursor % self.capacity
+        return self._buffer[start:start + n], cursor + n
+
+
+class CommandBuffer:
+    """
+    Preallocated capture buffer for one spoken command.
+    Chunks are gain-boosted in place with int16 saturation, the RMS is updated
+    incrementally, and the recorded audio is exposed as a memoryview, so a whole
+    command costs no per-chunk allocations.
+    """
+
+    def __init__(self, max_seconds, sample_rate=16000, gain=2.5, max_chunk_frames=4000):
+        self.sample_rate = sample_rate
+        self.gain = gain
+        self._samples = np.zeros(int(max_seconds * sample_rate), dtype=np.int16)
+        self._scratch = np.zeros(max_chunk_frames, dtype=np.float32)
+        self.length = 0
+        self._sum_squares = 0.0
+
+    def reset(self):
+        self.length = 0
+        self._sum_squares = 0.0
+
+    @property
+    def full(self):
+        return self.length >= self._samples.size
+
+    @property
+    def rms(self):
+        return float(np.sqrt(self._sum_squares / self.length)) if self.length else 0.0
+
+    def append(self, samples):
+        """
+        Boost and store a chunk. Returns a view of the boosted samples just written.
+        """
+        start = self.length
+        n = min(samples.size, self._samples.size - start, self._scratch.size)
+        if n <= 0:
+            return self._samples[start:start]
+
+        scratch = self._scratch[:n]
+        np.multiply(samples[:n], self.gain, out=scratch, casting="unsafe")
+        np.clip(scratch, -32768, 32767, out=scratch)
+        self._sum_squares += float(np.dot(scratch, scratch))
+
+        out = self._samples[start:start + n]
+        np.copyto(out, scratch, casting="unsafe")
+        self.length += n
+        return out
+
+    def pcm(self):
+        """Raw little-endian int16 bytes of the recording, as a memoryview (no copy)."""
+        return memoryview(self._samples[:self.length]).cast("B")
+
+
+class ReplaySource:
+    """
+    Drop-in stand-in for MicrophoneCapture that serves pre-recorded PCM.
+    Same cursor/read interface, so listen() can be driven from WAV files or
+    in-memory buffers. With realtime=True reads are paced like a live mic.
+    """
+
+    def __init__(self, pcm, sample_rate=16000, chunk_frames=1600, realtime=False):
+        samples = pcm if isinstance(pcm, np.ndarray) else np.frombuffer(pcm, dtype=np.int16)
+        self._buffer = samples.astype(np.int16, copy=False)
+        self.sample_rate = sample_rate
+        self.chunk_frames = chunk_frames
+        self.realtime = realtime
+        self.running = False
+        self.overruns = 0
+        self._started_at = None
+        self._position = 0 # Furthest sample handed out; the "live edge" when not realtime
+
+    @classmethod
+    def from_wav(cls, path, **kwargs):
+        return cls(read_wav_pcm(path), **kwargs)
+
+    def start(self):
+        self.running = True
+        self._started_at = time.perf_counter()
+
+    def stop(self):
+        self.running = False
+
+    def _available(self):
+        if not self.realtime:
+            return self._buffer.size
+        elapsed = time.perf_counter() - self._started_at
+        return min(self._buffer.size, int(elapsed * self.sample_rate))
+
+    def cursor(self, preroll=0.0):
+        edge = self._available() if self.realtime else self._position
+        return max(0, edge - int(preroll * self.sample_rate))
+
+    def read(self, cursor, frames, timeout=2.0):
+        cursor = max(cursor, 0)
+        if self.realtime:
+            wait_for = (cursor + frames) / self.sample_rate - (time.perf_counter() - self._started_at)
+            if wait_for > 0:
+                time.sleep(min(wait_for, timeout))
+
+        n = max(0, min(frames, self._available() - cursor))
+        if n == 0 and cursor >= self._buffer.size:
+            self.running = False # End of recording behaves like a closed mic
+        self._position = max(self._position, cursor + n)
+        return self._buffer[cursor:cursor + n], cursor + n
+
+
+class EnergyGate:
+    """
+    Cheap pre-filter for always-on wake-word listening.
+    A vectorized RMS check (plus an optional speech-band energy ratio) decides whether a
+    chunk is worth sending to Kaldi; the gate stays open for `hold` seconds after the
+    last loud chunk so words are not chopped mid-utterance.
+    """
+
+    def __init__(self, sample_rate=16000, energy_threshold=150, noise_ratio=2.5, hold=1.0,
+                 speech_band=(300, 3400), min_band_ratio=0.3):
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.hold_samples = int(hold * sample_rate)
+        self.speech_band = speech_band
+        self.min_band_ratio = min_band_ratio # 0 disables the spectral check
+        self.noise_floor = None
+        self.samples_seen = 0
+        self.open_until = -1
+        self.stats = {"decoded": 0, "skipped": 0}
+
+    def _speech_band_ratio(self, x):
+        power = np.abs(np.fft.rfft(x)) ** 2
+        total = power.sum()
+        if total <= 0:
+            return 0.0
+        freqs = np.fft.rfftfreq(x.size, 1.0 / self.sample_rate)
+        lo, hi = self.speech_band
+        return float(power[(freqs >= lo) & (freqs <= hi)].sum() / total)
+
+    def process(self, samples):
+        """
+        Returns True if this chunk should be decoded, False if it can be skipped.
+        """
+        x = samples.astype(np.float32)
+        self.samples_seen += x.size
+        rms = float(np.sqrt(np.mean(x * x))) if x.size else 0.0
+
+        threshold = self.energy_threshold
+        if self.noise_floor is not None:
+            threshold = max(threshold, self.noise_floor * self.noise_ratio)
+
+        if rms > threshold:
+            if not self.min_band_ratio or self._speech_band_ratio(x) >= self.min_band_ratio:
+                self.open_until = self.samples_seen + self.hold_samples
+        else:
+            self.noise_floor = rms if self.noise_floor is None else 0.95 * self.noise_floor + 0.05 * rms
+
+        is_open = self.samples_seen <= self.open_until
+        self.stats["decoded" if is_open else "skipped"] += 1
+        return is_open
+
+
+class BargeInDetector:
+    """
+    Listens for "stop" while JARVIS is talking.
+    Each mic chunk is compared against the level of the PCM currently being played
+    (simple echo suppression with a self-calibrating coupling factor); only chunks
+    with energy well above the expected echo are passed to a small keyword grammar.
+    On a hit, on_interrupt() is called from the detector thread.
+    """
+
+    def __init__(self, capture, sink, recognizer, on_interrupt, keywords=("stop", "cancel", "quiet", "enough"),
+                 chunk_frames=1600, energy_threshold=300, echo_margin=2.0, hold=0.8):
+        self.capture = capture
+        self.sink = sink # Anything with recent_level(window) describing playback loudness
+        self.recognizer = recognizer
+        self.on_interrupt = on_interrupt
+        self.keywords = keywords
+        self.chunk_frames = chunk_frames
+        self.energy_threshold = energy_threshold
+        self.echo_margin = echo_margin
+        self.hold_chunks = max(1, int(hold * 16000 / chunk_frames))
+        self.echo_coupling = 0.5 # Mic level per unit of playback level; learned while talking
+        self.triggered = False
+        self.stats = {"chunks": 0, "decoded": 0, "interrupts": 0}
+        self._active = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._active.set()
+
+    def activate(self):
+        """Call when playback starts."""
+        self.triggered = False
+        self._active.set()
+
+    def deactivate(self):
+        """Call when playback ends."""
+        self._active.clear()
+
+    def _is_speech(self, mic_level):
+        echo_level = self.sink.recent_level()
+        expected = self.echo_coupling * echo_level
+        if mic_level > max(self.energy_threshold, self.echo_margin * expected):
+            return True
+        # Quiet relative to playback: treat as pure echo and refine the coupling estimate
+        if echo_level > 100:
+            ratio = min(mic_level / echo_level, 4.0)
+            self.echo_coupling = 0.9 * self.echo_coupling + 0.1 * ratio
+        return False
+
+    def _run_loop(self):
+        while self.running:
+            self._active.wait()
+            if not self.running:
+                break
+
+            cursor = self.capture.cursor()
+            self.recognizer.Reset()
+            hold = 0
+            while self.running and self._active.is_set():
+                view, cursor = self.capture.read(cursor, self.chunk_frames, timeout=0.5)
+                if len(view) == 0:
+                    continue
+                self.stats["chunks"] += 1
+
+                samples = view.astype(np.float32)
+                mic_level = float(np.sqrt(np.dot(samples, samples) / samples.size))
+                if self._is_speech(mic_level):
+                    hold = self.hold_chunks
+                elif hold:
+                    hold -= 1
+                else:
+                    continue
+
+                self.stats["decoded"] += 1
+                if self.recognizer.AcceptWaveform(view.tobytes()):
+                    heard = json.loads(self.recognizer.Result()).get("text", "")
+                else:
+                    heard = json.loads(self.recognizer.PartialResult()).get("partial", "")
+
+                if any(word in heard.split() for word in self.keywords):
+                    self.triggered = True
+                    self.stats["interrupts"] += 1
+                    self._active.clear()
+                    try:
+                        self.on_interrupt()
+                    except Exception as e:
+                        print(f"[jarvis] Barge-in handler error: {e}")
+
+
+class DecodeStats:
+    """
+    Per-recognizer latency and CPU accounting.
+    Wrap each decoder call in `with stats.measure():`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.max_latency = 0.0
+
+    @contextmanager
+    def measure(self):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            self.calls += 1
+            self.wall_time += wall
+            self.cpu_time += time.thread_time() - cpu_start
+            self.max_latency = max(self.max_latency, wall)
+
+    def summary(self):
+        avg_ms = (self.wall_time / self.calls * 1000) if self.calls else 0.0
+        return f"{self.name}: {self.calls} calls, avg {avg_ms:.1f}ms, max {self.max_latency * 1000:.1f}ms, cpu {self.cpu_time:.2f}s"
+
+
+class TranscriptionRace:
+    """
+    Runs several speech-to-text engines on the same buffer at once and returns the
+    first transcript that passes validation. Engines get a cancel event that is set
+    as soon as a winner is chosen, so slower decoders can bail out early.
+    Each engine runs on its own throwaway daemon thread: a hung network call can't
+    hold a shared worker and delay the next command's local decode.
+    """
+
+    def __init__(self):
+        self.stats = {} # engine -> wins/rejected/timeouts/errors/last_latency
+
+    def _count(self, name, key, value=None):
+        entry = self.stats.setdefault(name, {"wins": 0, "rejected": 0, "timeouts": 0, "errors": 0, "last_latency": None})
+        if value is None:
+            entry[key] += 1
+        else:
+            entry[key] = value
+
+    @staticmethod
+    def _start(name, fn, cancel, started):
+        """Run fn(cancel) on a daemon thread; started[future] is set when it actually begins."""
+        future = Future()
+
+        def target():
+            started[future] = time.time()
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(cancel))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name=f"stt-{name}", daemon=True).start()
+        return future
+
+    def run(self, engines, accept, min_confidence=0.0):
+        """
+        engines: list of (name, fn, deadline_seconds); fn(cancel_event) -> (text, confidence or None).
+        accept: fn(text) -> cleaned command or None.
+        Returns (engine_name, command), or (None, None) if nothing usable came back.
+        A transcript below `min_confidence` is only used if no engine does better.
+        Each engine's deadline counts from when it starts running.
+        """
+        cancel = threading.Event()
+        started = {}
+        futures = {self._start(name, fn, cancel, started): (name, deadline) for name, fn, deadline in engines}
+        pending = set(futures)
+        fallback = None
+
+        try:
+            while pending:
+                now = time.time()
+                for fut in list(pending):
+                    name, deadline = futures[fut]
+                    if fut in started and now - started[fut] >= deadline:
+                        pending.discard(fut)
+                        self._count(name, "timeouts")
+                if not pending:
+                    break
+
+                next_deadline = min(started.get(f, now) + futures[f][1] for f in pending) - now
+                done, _ = wait(pending, timeout=max(next_deadline, 0.01), return_when=FIRST_COMPLETED)
+
+                for fut in done:
+                    pending.discard(fut)
+                    name = futures[fut][0]
+                    self._count(name, "last_latency", round(time.time() - started[fut], 3))
+                    try:
+                        text, confidence = fut.result()
+                    except Exception as e:
+                        print(f"[jarvis] {name} STT Error: {e}")
+                        self._count(name, "errors")
+                        continue
+
+                    command = accept(text) if text else None
+                    if not command:
+                        self._count(name, "rejected")
+                        continue
+
+                    if confidence is not None and confidence < min_confidence:
+                        self._count(name, "rejected")
+                        if fallback is None or confidence > fallback[2]:
+                            fallback = (name, command, confidence)
+                        continue
+
+                    self._count(name, "wins")
+                    return name, command
+        finally:
+            cancel.set()
+
+        if fallback:
+            return fallback[0], fallback[1]
+        return None, None
+
+
+def read_wav_pcm(path, sample_rate=16000):
+    """
+    Load a mono 16-bit WAV file as raw PCM bytes, validating the format the pipeline expects.
+    """
+    with wave.open(path, "rb") as wf:
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() != sample_rate:
+            raise ValueError(f"{path}: expected mono 16-bit {sample_rate} Hz PCM")
+        return wf.readframes(wf.getnframes())
+
+
+def replay_wav(path, chunk_frames=1600, **endpointer_kwargs):
+    """
+    Replay a WAV file through a VoiceActivityEndpointer and report where it stopped.
+    """
+    pcm = read_wav_pcm(path)
+    endpointer = VoiceActivityEndpointer(**endpointer_kwargs)
+    step = chunk_frames * 2
+
+    for offset in range(0, len(pcm), step):
+        if endpointer.process(pcm[offset:offset + step]):
+            break
+
+    return {
+        "file": path,
+        "duration": len(pcm) / 2 / endpointer.sample_rate,
+        "speech_start": endpointer.speech_start_time,
+        "last_speech": endpointer.last_speech_time,
+        "endpoint": endpointer.endpoint_time,
+        "reason": endpointer.reason or "end_of_file",
+    }
+
+
+def _fmt(value):
+    return f"{value:6.2f}s" if value is not None else "     -"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded commands through the VAD endpointer.")
+    parser.add_argument("wavs", nargs="+", help="16 kHz mono int16 WAV files")
+    parser.add_argument("--hangover", type=float, default=0.3)
+    parser.add_argument("--min-duration", type=float, default=0.5)
+    parser.add_argument("--max-duration", type=float, default=8.0)
+    parser.add_argument("--threshold", type=float, default=200)
+    parser.add_argument("--chunk-frames", type=int, default=1600)
+    args = parser.parse_args(argv)
+
+    print(f"{'file':40} {'length':>7} {'start':>7} {'last':>7} {'endpoint':>8}  reason")
+    failures = 0
+    for path in args.wavs:
+        try:
+            r = replay_wav(
+                path,
+                chunk_frames=args.chunk_frames,
+                hangover=args.hangover,
+                min_duration=args.min_duration,
+                max_duration=args.max_duration,
+                energy_threshold=args.threshold,
+            )
+        except Exception as e:
+            print(f"{path:40} ERROR: {e}")
+            failures += 1
+            continue
+        print(f"{path[-40:]:40} {_fmt(r['duration'])} {_fmt(r['speech_start'])} {_fmt(r['last_speech'])} {_fmt(r['endpoint'])}   {r['reason']}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from audio_pipeline import ReplaySource, EnergyGate
+from jarvis_assistant import JarvisAssistant
+
+STAGES = ["wake", "record", "gate", "stt"]
+
+
+def word_errors(reference, hypothesis):
+    """
+    Word-level edit distance between two transcripts. Returns (errors, reference_word_count).
+    """
+    ref = reference.lower().split()
+    hyp = (hypothesis or "").lower().split()
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1], len(ref)
+
+
+def load_corpus(path):
+    """
+    Collect (wav_path, reference_text or None) pairs. References live in <name>.txt next to each WAV.
+    """
+    wavs = sorted(glob.glob(os.path.join(path, "*.wav"))) if os.path.isdir(path) else [path]
+    corpus = []
+    for wav in wavs:
+        ref_path = os.path.splitext(wav)[0] + ".txt"
+        reference = None
+        if os.path.exists(ref_path):
+            with open(ref_path) as f:
+                reference = f.read().strip()
+        corpus.append((wav, reference))
+    return corpus
+
+
+def percentiles(values):
+    if not values:
+        return "      -       -       -"
+    p50, p90, p99 = np.percentile(np.array(values) * 1000, [50, 90, 99])
+    return f"{p50:7.1f} {p90:7.1f} {p99:7.1f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay WAV fixtures through JarvisAssistant.listen() and report latency.")
+    parser.add_argument("corpus", help="Directory of 16 kHz mono WAVs (or a single WAV)")
+    parser.add_argument("--runs", type=int, default=1, help="Passes over the corpus")
+    parser.add_argument("--realtime", action="store_true", help="Pace audio like a live microphone")
+    parser.add_argument("--with-cloud", action="store_true", help="Include Google STT in the race")
+    parser.add_argument("--no-low-power", action="store_true", help="Decode every wake chunk")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"[bench] No WAV files found in {args.corpus}")
+        return 1
+
+    jarvis = JarvisAssistant(audio_source=ReplaySource(b""))
+    if not jarvis.vosk_model:
+        print("[bench] Vosk model unavailable; nothing to benchmark.")
+        return 1
+    jarvis.cloud_stt_enabled = args.with_cloud
+    jarvis.wake_low_power = not args.no_low_power
+    jarvis._get_command_recognizer() # Make sure the warm-up is not part of the first sample
+
+    timings = {stage: [] for stage in STAGES}
+    totals, cpu_times = [], []
+    errors = words = missed = 0
+    gate_stats = {"decoded": 0, "skipped": 0}
+
+    for _ in range(args.runs):
+        for wav, reference in corpus:
+            jarvis.mic_capture = ReplaySource.from_wav(wav, chunk_frames=jarvis.command_chunk_frames, realtime=args.realtime)
+            jarvis.mic_capture.start()
+            jarvis.wake_gate = EnergyGate()
+
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            command = jarvis.listen()
+            totals.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+
+            for key in gate_stats:
+                gate_stats[key] += jarvis.wake_gate.stats[key]
+            for stage, value in jarvis.listen_timings.items():
+                timings[stage].append(value)
+            if "wake" not in jarvis.listen_timings:
+                missed += 1
+
+            if reference is not None:
+                e, n = word_errors(reference, command)
+                errors += e
+                words += n
+            print(f"[bench] {os.path.basename(wav)}: '{command}'")
+
+    print(f"\n{'stage':10} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7}  samples")
+    for stage in STAGES:
+        print(f"{stage:10} {percentiles(timings[stage])}  {len(timings[stage])}")
+    print(f"{'total':10} {percentiles(totals)}  {len(totals)}")
+
+    print(f"\nCPU time: {sum(cpu_times):.2f}s total, {np.mean(cpu_times) * 1000:.1f}ms per utterance")
+    print(f"Wake misses: {missed}/{len(totals)}")
+    if words:
+        print(f"Word accuracy: {(1 - errors / words) * 100:.1f}% ({errors} errors / {words} words)")
+    print(f"Wake gate: {gate_stats['decoded']} chunks decoded, {gate_stats['skipped']} skipped")
+    print(jarvis.wake_decode_stats.summary())
+    print(jarvis.command_decode_stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from fake_ollama import FakeOllama, load_script
+from llm_client import AsyncLLMClient
+from benchmark_audio import percentiles
+from jarvis_assistant import JarvisAssistant
+from audio_pipeline import ReplaySource
+
+# One command per LLM path: identity reply, streamed chat, memory extraction, agentic loop
+DEFAULT_COMMANDS = [
+    "who are you",
+    "explain how a transistor works",
+    "remember that the spare key is in the blue drawer",
+]
+AGENTIC_COMMAND = "open calculator"
+
+
+class InstrumentedClient(AsyncLLMClient):
+    """AsyncLLMClient that attributes calls and client time to the command running on this thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.current = threading.local()
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self._count_lock = threading.Lock()
+
+    def _record(self, seconds):
+        label = getattr(self.current, "label", None)
+        with self._count_lock:
+            self.calls[label] += 1
+            self.seconds[label] += seconds
+
+    def chat(self, payload, deadline=None):
+        start = time.perf_counter()
+        try:
+            return super().chat(payload, deadline)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def stream(self, payload, deadline=None):
+        start = time.perf_counter()
+        try:
+            yield from super().stream(payload, deadline)
+        finally:
+            self._record(time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive process_command() against a fake Ollama and report latency.")
+    parser.add_argument("--commands", help="Text file with one command per line (default: built-in mix)")
+    parser.add_argument("--agentic", action="store_true", help=f"Add '{AGENTIC_COMMAND}' (runs the agentic loop's commands)")
+    parser.add_argument("--runs", type=int, default=5, help="Passes over the command list")
+    parser.add_argument("--concurrency", type=int, default=1, help="Commands in flight at once")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Client-side limit on concurrent Ollama requests")
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="Fake prompt-eval tokens per second")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Fake generated tokens per second")
+    parser.add_argument("--parallel", type=int, default=1, help="Fake server sequences at once (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--script", help="JSON reply script for the fake server")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the LLM response cache enabled")
+    args = parser.parse_args(argv)
+
+    if args.commands:
+        with open(args.commands) as f:
+            commands = [line.strip() for line in f if line.strip()]
+    else:
+        commands = list(DEFAULT_COMMANDS)
+    if args.agentic:
+        commands.append(AGENTIC_COMMAND)
+
+    fake = FakeOllama(port=0, prompt_eval_rate=args.prompt_rate, token_rate=args.token_rate,
+                      script=load_script(args.script) if args.script else None,
+                      max_parallel=args.parallel).start()
+
+    jarvis = JarvisAssistant(audio_source=ReplaySource(b""))
+    # Keep benchmark facts out of the real memory database
+    workdir = tempfile.mkdtemp(prefix="jarvis_bench_")
+    jarvis.memory.close()
+    jarvis.db_path = os.path.join(workdir, "bench_memory.db")
+    jarvis._init_db()
+    jarvis.conversation.clear()
+    if not args.with_cache:
+        jarvis.response_cache = None
+    jarvis.llm_client.close()
+    client = InstrumentedClient(base_url=fake.url, max_concurrency=args.llm_concurrency)
+    jarvis.llm_client = client
+
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+
+    def run(command):
+        client.current.label = command
+        start = time.perf_counter()
+        result = jarvis.process_command(command, silent=True)
+        latencies[command].append(time.perf_counter() - start)
+        if not result or "error" in str(result).lower():
+            failures[command] += 1
+
+    workload = commands * args.runs
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, workload))
+    wall = time.perf_counter() - wall_start
+
+    print(f"\n{'command':40} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7}  {'runs':>4} {'llm/cmd':>7} {'client ms':>9} {'fail':>4}")
+    for command in commands:
+        runs = len(latencies[command])
+        per_call = client.calls[command] / runs if runs else 0
+        client_ms = client.seconds[command] / runs * 1000 if runs else 0
+        print(f"{command[:40]:40} {percentiles(latencies[command])}  {runs:4} {per_call:7.1f} {client_ms:9.1f} {failures[command]:4}")
+    all_latencies = [v for values in latencies.values() for v in values]
+    print(f"{'all':40} {percentiles(all_latencies)}  {len(all_latencies):4}")
+
+    print(f"\nThroughput: {len(workload) / wall:.2f} commands/s at concurrency {args.concurrency} ({wall:.1f}s wall)")
+    print(f"Client: {client.summary()}")
+    print(f"Fake Ollama: {fake.stats['requests']} requests, {fake.stats['prompt_tokens']} prompt tokens, "
+          f"{fake.stats['eval_tokens']} generated tokens")
+    client.close()
+    fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Default replies, matched in order against the request's system + user text.
+# Agentic plans match the plan prompt; step-by-step replies key on its "Step: N" line,
+# so they stay deterministic when several requests are in flight.
+DEFAULT_SCRIPT = [
+    {"match": r"Output ONLY a JSON plan", "reply": {"plan": [
+        {"thought": "check the shell", "type": "terminal", "value": "true"},
+        {"thought": "goal reached", "type": "done", "value": "true"},
+    ]}},
+    {"match": r"Step: 1\b", "reply": {"thought": "check the shell", "type": "terminal", "value": "true"}},
+    {"match": r"Step: \d+", "reply": {"thought": "goal reached", "type": "done", "value": "true"}},
+    {"match": r"Analyze this fact", "reply": {"key": "benchmark_fact", "value": "A fact stored by the benchmark."}},
+    {"match": r"Confirm you hear me", "reply": "Loud and clear, Sir. At your service, as ever."},
+    {"match": r".", "reply": "Certainly, Sir. Here is a considered answer. It runs to a few sentences, "
+                             "so the streaming path has something to split. That should suffice."},
+]
+
+
+def estimate_tokens(text):
+    """Rough llama-style token count: about four characters per token."""
+    return max(1, len(text) // 4)
+
+
+class FakeOllama:
+    """
+    Stand-in for Ollama's /api/chat. Sleeps for prompt evaluation and generation at
+    configurable token rates, answers from a script, and reports Ollama's timing fields.
+    """
+
+    def __init__(self, host="127.0.0.1", port=11435, prompt_eval_rate=400.0, token_rate=40.0,
+                 script=None, max_parallel=1):
+        self.prompt_eval_rate = prompt_eval_rate
+        self.token_rate = token_rate
+        self.script = [(re.compile(rule["match"]), rule["reply"]) for rule in (script or DEFAULT_SCRIPT)]
+        # Ollama runs a fixed number of sequences at once (OLLAMA_NUM_PARALLEL); the rest queue
+        self.slots = threading.Semaphore(max_parallel)
+        self.stats = {"requests": 0, "prompt_tokens": 0, "eval_tokens": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake.handle_chat(self, body)
+
+            def _send_json(self, obj):
+                payload = json.dumps(obj).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def reply_for(self, messages):
+        text = "\n".join(m.get("content", "") for m in messages if m.get("role") in ("system", "user"))
+        for pattern, reply in self.script:
+            if pattern.search(text):
+                return reply if isinstance(reply, str) else json.dumps(reply)
+        return ""
+
+    def handle_chat(self, handler, body):
+        messages = body.get("messages", [])
+        reply = self.reply_for(messages)
+        prompt_tokens = estimate_tokens("".join(m.get("content", "") for m in messages))
+        # Split into whitespace-preserving pieces so streamed deltas concatenate back to the reply
+        pieces = re.findall(r"\S+\s*|\s+", reply) or [""]
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["eval_tokens"] += len(pieces)
+
+        start = time.perf_counter()
+        with self.slots:
+            time.sleep(prompt_tokens / self.prompt_eval_rate)
+            prompt_done = time.perf_counter()
+
+            if body.get("stream", True):
+                handler.send_response(200)
+                handler.send_header("Content-Type", "application/x-ndjson")
+                handler.send_header("Transfer-Encoding", "chunked")
+                handler.end_headers()
+                for piece in pieces:
+                    time.sleep(1.0 / self.token_rate)
+                    self._write_chunk(handler, {"model": body.get("model"), "message": {"role": "assistant", "content": piece}, "done": False})
+                self._write_chunk(handler, self._final(body, "", prompt_tokens, len(pieces), start, prompt_done))
+                handler.wfile.write(b"0\r\n\r\n")
+            else:
+                time.sleep(len(pieces) / self.token_rate)
+                handler._send_json(self._final(body, reply, prompt_tokens, len(pieces), start, prompt_done))
+
+    def _final(self, body, content, prompt_tokens, eval_tokens, start, prompt_done):
+        end = time.perf_counter()
+        return {
+            "model": body.get("model"),
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int((prompt_done - start) * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int((end - prompt_done) * 1e9),
+            "total_duration": int((end - start) * 1e9),
+        }
+
+    @staticmethod
+    def _write_chunk(handler, obj):
+        line = (json.dumps(obj) + "\n").encode("utf-8")
+        handler.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        handler.wfile.flush()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_script(path):
+    """Script file: JSON list of {"match": regex, "reply": str or JSON object}."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Ollama /api/chat for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="Prompt-eval tokens per second")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Generated tokens per second")
+    parser.add_argument("--parallel", type=int, default=1, help="Sequences evaluated at once (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--script", help="JSON reply script (see DEFAULT_SCRIPT)")
+    args = parser.parse_args(argv)
+
+    fake = FakeOllama(args.host, args.port, args.prompt_rate, args.token_rate,
+                      load_script(args.script) if args.script else None, args.parallel)
+    print(f"[fake-ollama] Serving {fake.url}/api/chat")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import re
+import zlib
+import numpy as np
+from collections import defaultdict
+
+
+class IntentRouter:
+    """
+    Keyword router compiled once: every keyword of every rule goes into a single
+    regex, so one scan of the command reports all rules that matched.
+
+    rules: iterable of (name, keywords, options). Keywords match as plain substrings,
+    like `in`. Options:
+      - "priority": lower wins in first() (default: declaration order)
+
+    Matching is overlap-aware: the scan reports the longest keyword starting at each
+    position, and every keyword contained in it is credited too, so "status report"
+    still counts as a hit for a rule on "status".
+    """
+
+    def __init__(self, rules):
+        self.priority = {}
+        owners = defaultdict(list) # keyword -> rule names
+        for order, (name, keywords, *options) in enumerate(rules):
+            opts = options[0] if options else {}
+            self.priority[name] = opts.get("priority", order)
+            for keyword in keywords:
+                owners[keyword].append(name)
+
+        keywords = sorted(owners, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + self._trie_regex(keywords) + "))")
+
+        # For each keyword the scan can report, every rule it implies (its own and those of
+        # the keywords it contains)
+        self._implied = {}
+        for outer in keywords:
+            self._implied[outer] = frozenset(name for inner in keywords if inner in outer for name in owners[inner])
+
+    @staticmethod
+    def _trie_regex(keywords):
+        """
+        Alternation factored by common prefixes ("status|status report" -> "status(?: report)?"),
+        which keeps the per-position work of the scan small. Longest match wins at each position.
+        """
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for ch in keyword:
+                node = node.setdefault(ch, {})
+            node[""] = True
+
+        def build(node):
+            ends = "" in node
+            branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            if ends:
+                return "(?:" + body + ")?" # Greedy: prefer the longer keyword
+            return body
+
+        return build(trie)
+
+    def match(self, text):
+        """Names of all rules with a keyword in text (one regex scan)."""
+        return set().union(*map(self._implied.__getitem__, self._pattern.findall(text)))
+
+    def first(self, hits, names=None):
+        """Highest-priority rule among hits (optionally restricted to names), or None."""
+        candidates = hits if names is None else hits.intersection(names)
+        return min(candidates, key=self.priority.__getitem__, default=None)
+
+
+class ExemplarClassifier:
+    """
+    Nearest-exemplar intent classifier for commands the keyword rules miss.
+    Text is embedded with a hashed bag of character n-grams and words (no model to load),
+    and one matrix product scores the command against every exemplar phrase.
+
+    exemplars: iterable of (intent, phrases) or (intent, phrases, {"threshold": t}).
+    An intent of None marks negative exemplars (general questions that must reach the LLM):
+    if one of those is closest, nothing is returned. A match must reach its intent's
+    threshold and beat the best exemplar of any other intent by `margin`.
+    """
+
+    def __init__(self, exemplars, dim=2 ** 12, threshold=0.72, margin=0.1, ngram_range=(3, 4)):
+        self.dim = dim
+        self.threshold = threshold
+        self.margin = margin
+        self.ngram_range = ngram_range
+        self.intents = []
+        self.thresholds = []
+        labels, vectors = [], []
+        for intent, phrases, *options in exemplars:
+            opts = options[0] if options else {}
+            self.intents.append(intent)
+            self.thresholds.append(opts.get("threshold", threshold))
+            for phrase in phrases:
+                labels.append(len(self.intents) - 1)
+                vectors.append(self.embed(phrase))
+        self._labels = np.array(labels, dtype=np.int64)
+        self._matrix = np.vstack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+
+    def _features(self, text):
+        words = re.findall(r"[a-z0-9']+", text.lower())
+        padded = f" {' '.join(words)} "
+        lo, hi = self.ngram_range
+        for n in range(lo, hi + 1):
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n]
+        for word in words:
+            yield "w:" + word
+
+    def embed(self, text):
+        """L2-normalised hashed feature vector (float32, length dim)."""
+        buckets = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in self._features(text)), dtype=np.int64)
+        vector = np.sqrt(np.bincount(buckets % self.dim, minlength=self.dim).astype(np.float32)) # Damp repeats
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, text):
+        """Cosine similarity against every exemplar."""
+        return self._matrix @ self.embed(text)
+
+    def classify(self, text):
+        """(intent, score) for the closest exemplar, or (None, score) if it isn't a confident match."""
+        if not len(self._labels):
+            return None, 0.0
+        sims = self.scores(text)
+        # Best score per intent, then compare the winner against the runner-up intent
+        per_intent = np.full(len(self.intents), -1.0, dtype=np.float32)
+        np.maximum.at(per_intent, self._labels, sims)
+        best = int(np.argmax(per_intent))
+        score = float(per_intent[best])
+        per_intent[best] = -1.0
+        runner_up = float(per_intent.max()) if len(per_intent) > 1 else 0.0
+        intent = self.intents[best]
+        if intent is None or score < self.thresholds[best] or score - runner_up < self.margin:
+            return None, score
+        return intent, score
@@ -24,13 +24,20 @@ from contextlib import contextmanager
 import shutil
 from dotenv import load_dotenv
 from gesture_control import HandGestureController
+from audio_pipeline import VoiceActivityEndpointer, MicrophoneCapture, TranscriptionRace, EnergyGate, DecodeStats, CommandBuffer, BargeInDetector
+from speech_output import PlaybackSink, SpeechCache, SpeechPipeline, SpeechScheduler, SpeechStream, PRIORITY_ALERT, PRIORITY_NORMAL
+from intent_router import IntentRouter, ExemplarClassifier
+from memory_store import Turn, ConversationWindow, MemoryStore
+from llm_client import StreamCleaner, SentenceAccumulator, PromptBuilder, ResponseCache, AsyncLLMClient, ContextBudget
 from piper import PiperVoice
 from piper.config import SynthesisConfig
-import sqlite3
 import vosk
 import wave
 import re
-import numpy as np
+import shlex
+import signal
+import tempfile
+import selectors
 vosk.SetLogLevel(-1) # Silence Kaldi/Vosk logs
 
 # Load environment variables from .env file
@@ -68,10 +75,121 @@ def no_alsa_err():
 # ==========================================
 
 class JarvisAssistant:
-    def __init__(self, event_callback=None):
+    # Commands that may be committed from a Vosk partial before the recording ends.
+    # Only exact phrases that determine_intent() routes to non-LLM actions belong here.
+    FAST_PATH_PHRASES = {
+        "mute", "mute volume", "volume up", "volume down", "louder", "quieter",
+        "screenshot", "take screenshot", "capture screen",
+        "battery", "battery status", "cpu", "system status", "status report", "systems check",
+    }
+    # Fast-path phrases that also start longer commands ("volume up" / "volume up to eighty").
+    # A stable partial can't tell those apart from a pause mid-command, so they only commit
+    # once the endpointer has heard the speaker stop.
+    FAST_PATH_EXTENDABLE = {"mute", "volume up", "volume down", "battery", "cpu"}
+
+    # Keyword rules for determine_intent(), compiled once into a single scan.
+    # Plain substring semantics throughout, matching the original `in` checks.
+    INTENT_ROUTER = IntentRouter([
+        ("confirm_yes", ["yes", "confirm", "proceed", "do it"]),
+        ("confirm_no", ["no", "cancel", "abort", "stop"]),
+        ("delete", ["delete", "remove", "clear", "trash", "wipe"]),
+        ("memory_target", ["memory", "memories", "history", "database"]),
+        ("visual_target", ["screenshot", "photo", "image"]),
+        ("contextual", ["it", "that", "this"]),
+        ("telegram_send", ["send image", "send photo", "send the image", "send the screenshot", "transmit photo"]),
+        # Hyper-fast cache: declaration order is priority (first listed wins)
+        ("fast_stats", ["battery", "cpu", "percentage", "status"]),
+        ("fast_camera", ["take photo"]),
+        ("fast_status_report", ["status report", "systems check"]),
+        ("fast_search", ["search"]),
+        ("fast_clock", ["time", "what time", "current time", "date", "what day"]),
+        ("screenshot_take", ["take screenshot", "capture screen"]),
+        ("volume", ["volume", "louder", "quieter", "mute", "silent"]),
+        ("volume_up", ["up", "louder"]),
+        ("volume_down", ["down", "quieter"]),
+        ("volume_mute", ["mute", "silent"]),
+        ("stop", ["stop", "cancel", "shh", "wait"]),
+        ("shutdown", ["shutdown", "quit program", "exit jarvis"]),
+        ("identity", ["who are you", "what is your name", "hello", "hi jarvis", "are you there", "can you hear me"]),
+        ("health", ["battery", "cpu", "percentage", "ram", "temp", "health", "system check", "stats"]),
+    ])
+    FAST_INTENTS = {
+        "fast_stats": {"action": "system_stats"},
+        "fast_camera": {"action": "camera", "sub_action": "capture"},
+        "fast_status_report": {"action": "status_report"},
+        "fast_search": None, # Built per call from the command text
+        "fast_clock": {"action": "clock"},
+    }
+
+    # Middle tier for paraphrases the keyword rules miss ("make it brighter", "grab my screen").
+    # Commands below the classifier's threshold, or not clearly ahead of the next intent, still go to the LLM.
+    # Intents that change the system need a closer match than read-only reports; Telegram and camera
+    # send or capture something personal, so they need a near-verbatim match.
+    INTENT_EXEMPLARS = [
+        ({"action": "screenshot", "sub_action": "take"}, [
+            "grab my screen", "snap the screen", "screen capture", "capture my display",
+            "take a picture of the screen", "save what's on screen", "screengrab"], {"threshold": 0.85}),
+        ({"action": "camera", "sub_action": "capture"}, [
+            "take a picture of me", "snap a selfie", "take a selfie", "use the webcam", "capture my face",
+            "take a picture with the camera", "photograph me"], {"threshold": 0.9}),
+        ({"action": "brightness", "level": 100}, [
+            "make it brighter", "make the screen brighter", "brighten the screen", "increase brightness", "full brightness",
+            "the screen is too dark", "turn the brightness up", "brighten"], {"threshold": 0.85}),
+        ({"action": "brightness", "level": 40}, [
+            "make it darker", "dim the screen", "lower the brightness", "reduce brightness",
+            "the screen is too bright", "turn the brightness down", "dim the display"], {"threshold": 0.85}),
+        ({"action": "volume", "type": "up"}, [
+            "turn it up", "increase the sound", "i can't hear you", "make it loud",
+            "raise the sound", "speak up"], {"threshold": 0.85}),
+        ({"action": "volume", "type": "down"}, [
+            "turn it down", "lower the sound", "that's too loud", "decrease the sound", "reduce the sound"], {"threshold": 0.85}),
+        ({"action": "volume", "type": "mute"}, [
+            "kill the sound", "silence the audio", "no sound", "turn the sound off"], {"threshold": 0.85}),
+        ({"action": "system_stats"}, [
+            "how is my laptop doing", "how much juice is left", "how much power is left",
+            "is my laptop running hot", "is the computer overheating", "how is the processor"]),
+        ({"action": "status_report"}, [
+            "give me a full report", "run diagnostics", "run a diagnostic", "diagnostics", "full system report"]),
+        ({"action": "clock"}, [
+            "what hour is it", "which day is it today", "tell me the day", "what's today"]),
+        ({"action": "history"}, [
+            "show my conversation log", "what did we talk about", "show past conversations",
+            "show our chat log"]),
+        ({"action": "system", "type": "gesture_on"}, [
+            "enable hand gestures", "turn on hand gestures", "activate gesture control", "start hand tracking", "turn on gestures"], {"threshold": 0.85}),
+        ({"action": "system", "type": "gesture_off"}, [
+            "disable hand gestures", "turn off hand gestures", "deactivate gesture control", "stop hand tracking", "turn off gestures"], {"threshold": 0.85}),
+        ({"action": "telegram", "sub_action": "send_latest_screenshot"}, [
+            "send that to my phone", "forward the screenshot to telegram", "share the picture on telegram",
+            "text me the screenshot"], {"threshold": 0.9}),
+        ({"action": "file", "operation": "open", "name": "latest_photo"}, [
+            "show me the last photo", "show me the latest photo", "open my latest picture", "display the latest screenshot",
+            "show the newest picture"], {"threshold": 0.85}),
+        # Negative exemplars: questions that share words with the actions above but belong to the LLM
+        (None, [
+            "send an email to my boss", "send that email", "write a message to my friend",
+            "show me a picture of a cat", "what does a picture of me say", "what is a picture worth",
+            "what is screen capture software", "how does a screen capture tool work", "what is a webcam",
+            "show me the last episode", "show me the latest news", "open the last chapter",
+            "tell me the day the war ended", "what day was the battle", "which day is christmas",
+            "how much power is left in the sun", "how hot is the sun", "how is the weather doing",
+            "what is brightness", "explain how volume works", "what is sound",
+            "show me the last photo of mars", "show me pictures of the moon", "open the latest article",
+            "make it darker outside", "why does it get darker in winter", "make the story darker",
+            "turn on gestures in chrome", "enable gestures in my browser", "how do hand gestures work",
+            "run a diagnostic on my car", "how do i run diagnostics on a server", "give me a report on the war",
+            "how much is left", "how much money is left", "how much time is left in the game"]),
+    ]
+    INTENT_CLASSIFIER = ExemplarClassifier(INTENT_EXEMPLARS, threshold=0.8)
+
+    # Terminal output that means a step failed even when the exit code says otherwise
+    AGENTIC_FAILURE_PATTERN = re.compile(r"command not found|No such file or directory|Permission denied|Unable to locate", re.IGNORECASE)
+
+    def __init__(self, event_callback=None, audio_source=None):
         """
         Initialize the system, TTS engine, and print a "Systems Online" startup sequence.
         param event_callback: A function(event_name, data_dict) to send updates to UI.
+        param audio_source: Optional capture object (e.g. ReplaySource) used instead of the microphone.
         """
         self.event_callback = event_callback
         self.lock = threading.Lock()
@@ -79,11 +197,19 @@ class JarvisAssistant:
         self.is_speaking = False
         self.thread_local = threading.local()
         self.is_speaking = False
+        self.speech_interrupts = 0 # Bumped by stop_speaking(); live replies stop when it changes
         self.last_created_item = None # Context for "that folder"
         self.pending_confirmation = None # For sensitive commands
+        self.agentic_plan_mode = True # One LLM call per plan instead of per step
+        self.agentic_max_replans = 2
+        self.terminal_mode = "headless" # "visible" runs commands inside a terminal window instead
+        self.terminal_mirror = False # Headless mode: also show output in a terminal window
+        self.terminal_output_cap = 64 * 1024 # Bytes of command output kept for the agent
+        self.terminal_stream_lines = 200 # Output lines streamed to the UI per command
+        self.barge_in = None # Set up with the microphone; the speech worker checks it
         
         # Initialize Speech Queue and Background Worker
-        self.speech_queue = []
+        self.speech_queue = SpeechScheduler(default_ttl=30.0) # Priority queue; stale replies expire
         self.speech_worker_thread = threading.Thread(target=self._speech_worker, daemon=True)
         self.speech_worker_thread.start()
         
@@ -95,15 +221,36 @@ class JarvisAssistant:
             print(f"[jarvis] Warning: TTS Engine failed to initialize: {e}")
             self.engine = None
         
+        # Shared PortAudio instance (speech output + microphone)
+        try:
+            with no_alsa_err():
+                self.p = pyaudio.PyAudio()
+        except Exception as e:
+            print(f"[jarvis] Warning: PortAudio failed to initialize: {e}")
+            self.p = None
+
         # Initialize Piper TTS
         try:
+            if self.p is None:
+                raise RuntimeError("no audio output device")
             model_path = "/home/justin/Desktop/jarvis_project/piper_tts/jarvis.onnx"
             # We assume the config .json is in the same folder with .json extension appended
             self.piper_voice = PiperVoice.load(model_path)
+            # Persistent output stream instead of an aplay process per sentence
+            self.audio_sink = PlaybackSink(self.p, sample_rate=self.piper_voice.config.sample_rate)
+            # length_scale=1.05 for a slightly more sophisticated, deliberate tone
+            self.synthesis_config = SynthesisConfig(length_scale=1.05)
+            self.voice_id = f"{model_path}|length_scale=1.05"
+            # Recurring phrases are played from cache instead of re-synthesized
+            self.speech_cache = SpeechCache(disk_dir="/home/justin/Desktop/jarvis_project/tts_cache")
+            # Sentence pipeline: synthesis runs ahead of playback
+            self.speech_pipeline = SpeechPipeline(self._synthesize_segment, self.audio_sink, lookahead=2)
             self.emit_log("Piper Neural TTS Initialized.")
         except Exception as e:
             print(f"[jarvis] Warning: Piper TTS failed to initialize: {e}")
             self.piper_voice = None
+            self.audio_sink = None
+            self.speech_cache = None
         
         # Initialize Speech Recognition
         self.recognizer = sr.Recognizer()
@@ -111,7 +258,13 @@ class JarvisAssistant:
         self.recognizer.energy_threshold = 1500 
         self.recognizer.dynamic_energy_threshold = True # Let it adapt slightly
         self.recognizer.pause_threshold = 0.8 # Slightly faster turn-around
-        self.speech_process = None 
+
+        # Parallel STT: Google and Vosk race on the same buffer
+        self.stt_race = TranscriptionRace()
+        self.stt_deadlines = {"google": 4.0, "vosk": 6.0}
+        self.stt_min_confidence = 0.5
+        self.recognizer.operation_timeout = self.stt_deadlines["google"]
+        self.vosk_lock = threading.Lock() # Guards the command recognizer (not thread-safe)
         
         # Check dependencies for health monitoring
         try:
@@ -133,8 +286,31 @@ class JarvisAssistant:
         except Exception:
             self.microphone = sr.Microphone() # Fallback
 
-        self.session = requests.Session()
+        # Shared by voice, Telegram and Web: caps concurrent Ollama requests and coalesces duplicates
+        self.llm_client = AsyncLLMClient(max_concurrency=2, timeout=30.0, retries=2)
+        self.llm_deadline = 45.0 # Whole-call budget, including queueing behind other channels
         self.model = "llama3.2:1b"
+        self.llm_keep_alive = "30m" # Keep the model (and its KV cache) resident between commands
+        self.llm_stats = {}
+        self.context_token_budget = 800 # Memory + history tokens per request
+        self.max_fact_rows = 50 # Facts fetched per lookup before budgeting
+        # Default persona. Must stay free of per-call data so the prompt prefix is cacheable.
+        self.prompt_builder = PromptBuilder("""
+            You are jarvis., a highly advanced AI developed by Justin.
+            
+            Personality: British, sophisticated, slightly dry wit, loyal, and highly efficient. 
+            Tone: Professional, calm, and brilliant. Call the user 'Sir'.
+            
+            Current Core Architecture:
+            - Neural Memory: Local SQLite Database (jarvis_memory.db).
+            - Speech Engine: 100% Local Neural Engine (Vosk/Piper). No cloud dependencies for voice.
+            - Visual Protocols: Capable of taking, sending, and deleting screenshots.
+            - Efficiency: Running in Eco-Efficient mode (optimized polling).
+            
+            Contextual Awareness: You have access to the last 5 conversation turns from your neural memory.
+            Constraints: Never call yourself J.A.R.V.I.S. or mention Iron Man. 
+            Do NOT output internal thoughts or JSON metadata. Speak ONLY natural dialogue.
+            """)
         self.telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
         
         self.emit_log("Loading core modules...")
@@ -155,26 +331,71 @@ class JarvisAssistant:
         self.db_path = "/home/justin/Desktop/jarvis_project/jarvis_memory.db"
         self._init_db()
         self._migrate_json_to_sql()
+        # Recent turns kept in process for intent resolution and prompts; seeded once from SQL
+        self.conversation = ConversationWindow(maxlen=20)
+        self.conversation.seed([Turn(h["user"], h["assistant"], h.get("intent"), timestamp=h["timestamp"])
+                                for h in self.load_history(limit=20)])
+
+        # Opt-in cache for deterministic LLM sub-calls (ask_ai(..., cache=True))
+        try:
+            self.response_cache = ResponseCache("/home/justin/Desktop/jarvis_project/llm_cache.db")
+        except Exception as e:
+            print(f"[jarvis] Response cache disabled: {e}")
+            self.response_cache = None
+
+        # Command Endpointing (VAD). Disable to fall back to the fixed 3.5s window.
+        self.endpointing_enabled = True
+        self.command_min_duration = 0.5
+        self.command_max_duration = 8.0
+        self.endpoint_hangover = 0.3 # Stop ~300ms after speech ends
+        self.command_chunk_frames = 1600 # 100ms reads keep endpoint resolution tight
+        self.capture_preroll = 0.5 # Seconds of audio kept before the wake-word hit
+
+        # Low-power wake listening: skip Kaldi on silent chunks
+        self.wake_low_power = True
+        self.wake_gate = EnergyGate()
+        self.wake_lookback = 0.5 # Seconds re-decoded when the gate opens
+
+        # Streaming dispatch: decode partials during capture and commit fast-path intents early
+        self.streaming_dispatch = True
+        self.mic_capture = audio_source
+        # One preallocated, reusable buffer for command audio (max length + pre-roll)
+        self.command_buffer = CommandBuffer(self.command_max_duration + self.capture_preroll + 1.0)
+        self.cloud_stt_enabled = True # Benchmarks turn this off to measure the local path only
+        self.listen_timings = {} # Per-stage wall time of the last listen() call
 
         # Initialize Local Speech Engine (Vosk)
         try:
-            self.p = pyaudio.PyAudio()
             model_path = "/home/justin/Desktop/jarvis_project/vosk_model"
             self.vosk_model = vosk.Model(model_path)
             
-            # --- INTELLIGENT VOCAB LIST ---
-            # Biasing the engine toward Jarvis's known commands dramatically improves accuracy.
-            # We include common words AND Jarvis's specific command keys.
-            commands = [
-                "jarvis", "screenshot", "delete", "remove", "clear", "trash", 
-                "status", "report", "health", "system", "battery", "cpu", 
-                "open", "launch", "search", "google", "web", "volume", 
-                "up", "down", "mute", "stop", "cancel", "shh", "quiet",
-                "hello", "hi", "who", "are", "you", "can", "hear", "me"
-            ]
-            # Convert to JSON string for Vosk
-            vocab = json.dumps(commands + ["[unk]"]) # [unk] allows for general speech too
-            self.vosk_recognizer = vosk.KaldiRecognizer(self.vosk_model, 16000, vocab)
+            # --- DEDICATED WAKE RECOGNIZER ---
+            # A two-entry grammar keeps continuous spotting cheap; everything else maps to [unk].
+            self.wake_recognizer = vosk.KaldiRecognizer(self.vosk_model, 16000, json.dumps(["jarvis", "[unk]"]))
+            self.wake_decode_stats = DecodeStats("wake")
+
+            # --- COMMAND RECOGNIZER ---
+            # Full vocabulary, built lazily (warmed in the background) and reused across commands.
+            self.command_recognizer = None
+            self.command_decode_stats = DecodeStats("command")
+            threading.Thread(target=self._get_command_recognizer, daemon=True).start()
+            
+            # Persistent microphone: one stream for the lifetime of the assistant
+            if self.mic_capture is None:
+                self.mic_capture = MicrophoneCapture(self.p, chunk_frames=self.command_chunk_frames)
+            with no_alsa_err():
+                self.mic_capture.start()
+
+            # --- BARGE-IN ---
+            # Tiny "stop" grammar, only decoded when the mic is louder than our own echo
+            if self.audio_sink:
+                stop_grammar = json.dumps(["stop", "cancel", "quiet", "enough", "jarvis", "[unk]"])
+                self.barge_in = BargeInDetector(
+                    self.mic_capture, self.audio_sink,
+                    vosk.KaldiRecognizer(self.vosk_model, 16000, stop_grammar),
+                    on_interrupt=self._on_barge_in,
+                )
+                self.barge_in.start()
             
             self.emit_log("Local Neural Speech Engine (Vosk) Online.")
         except Exception as e:
@@ -249,6 +470,12 @@ class JarvisAssistant:
         if self.event_callback:
             self.event_callback('new_log', {'message': message, 'type': 'user' if user else 'system'})
 
+    def emit_log_delta(self, stream_id, delta, end=False):
+        """Append a streamed fragment to an in-progress UI log line (no terminal print).
+        end=True tells the UI the stream is finished."""
+        if self.event_callback:
+            self.event_callback('new_log', {'message': delta, 'type': 'system', 'stream_id': stream_id, 'stream_end': end})
+
     def set_voice_config(self):
         """
         Configure TTS voice settings for a more 'Jarvis-like' feel.
@@ -267,47 +494,41 @@ class JarvisAssistant:
         self.engine.setProperty('rate', 160)
         self.engine.setProperty('volume', 1.0)
 
+    def _synthesize_segment(self, text):
+        """
+        Yield PCM for one sentence, from the speech cache when possible.
+        Runs on the pipeline's synthesis thread.
+        """
+        cache = self.speech_cache
+        cache_key = cache.key(text, self.voice_id) if cache.cacheable(text) else None
+        if cache_key:
+            pcm = cache.get(cache_key)
+            if pcm is not None:
+                yield pcm
+                return
+
+        chunks = []
+        for chunk in self.piper_voice.synthesize(text, syn_config=self.synthesis_config):
+            if cache_key:
+                chunks.append(chunk.audio_int16_bytes)
+            yield chunk.audio_int16_bytes
+
+        # Only complete segments reach this point, so partial audio is never cached
+        if cache_key:
+            cache.put(cache_key, b"".join(chunks))
+
     def _stream_piper_voice(self, text):
         """
-        Generate and stream voice using Piper TTS directly to aplay.
+        Speak text with Piper TTS through the sentence pipeline and persistent playback sink.
         """
         if not self.piper_voice:
              print("[jarvis] Piper Voice not loaded. Fallback to print.")
              return
 
-        # Prepare aplay command for raw 16-bit 22050Hz mono audio
-        cmd = ["aplay", "-r", "22050", "-f", "S16_LE", "-t", "raw", "-"]
-        
         try:
-            self.speech_process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
-            
-            # Synthesize and stream directly to aplay's stdin
-            # length_scale=1.05 for a slightly more sophisticated, deliberate tone
-            config = SynthesisConfig(length_scale=1.05)
-            for chunk in self.piper_voice.synthesize(text, syn_config=config):
-                if self.speech_process is None: # Interrupted
-                    break
-                try:
-                    self.speech_process.stdin.write(chunk.audio_int16_bytes)
-                    self.speech_process.stdin.flush()
-                except (BrokenPipeError, ValueError):
-                    break
-            
-            # Close stdin to signal EOF
-            if self.speech_process and self.speech_process.stdin:
-                try:
-                    self.speech_process.stdin.close()
-                except:
-                    pass
-            
-            # Wait for playback to finish
-            if self.speech_process:
-                self.speech_process.wait()
-                
+            self.speech_pipeline.speak(text)
         except Exception as e:
             print(f"[jarvis] Piper Audio Error: {e}")
-        finally:
-            self.speech_process = None
 
     def _speak_thread(self, text):
         """
@@ -330,50 +551,36 @@ class JarvisAssistant:
 
     def check_for_interrupt(self):
         """
-        Listens for a brief moment to check for 'stop' keywords.
-        Returns True if interrupted.
+        Returns True if the user barged in ("stop", "cancel"...) during the current utterance.
+        Detection itself runs on the BargeInDetector thread while is_speaking is set.
         """
-        # We need a separate recognizer instance to avoid conflict with main loop if threaded (but here we are in speak thread)
-        # Actually, using a simple short-listen strategy with Energy Threshold
-        try:
-            # Only check if we are actually speaking
-            if not self.is_speaking:
-                return False
-
-            # Non-blocking check? It is hard in a while loop.
-            # Faster approach: Use a dedicated 'Hotword' listener style or check microphone energy.
-            # For simplicity in this loop without blocking playback too much:
-            # We can't really "listen" for words while playing audio without echo cancellation
-            # BUT the user asked for it. We will try to peek at audio levels or just a generic 'stop' input if possible.
-            
-            # Since full recog is slow, we will assume the main loop handles the listening?
-            # NO, the main loop is BLOCKED by t.join() in log_and_speak.
-            # We need to change log_and_speak to NOT join if we want parallel listening.
-            return False 
-        except:
-            return False
+        return bool(self.barge_in and self.barge_in.triggered)
+
+    def _on_barge_in(self):
+        """Called from the barge-in thread when the user talks over JARVIS."""
+        self.emit_log("Barge-in detected. Standing by.")
+        self.stop_speaking()
 
     def _speech_worker(self):
         """Background thread to process the speech queue sequentially."""
         while True:
-            text = None
-            with self.lock:
-                if self.speech_queue:
-                    text = self.speech_queue.pop(0)
+            # Blocks on the scheduler's condition variable until something is queued
+            text = self.speech_queue.get()
             
-            if text:
-                self.is_speaking = True
-                self.emit_status("speaking")
-                self._stream_piper_voice(text)
-                self.is_speaking = False
-                self.emit_status("idle")
-            else:
-                # Increase sleep when idle to reduce context switching
-                time.sleep(0.5)
+            self.is_speaking = True
+            self.emit_status("speaking")
+            if self.barge_in:
+                self.barge_in.activate()
+            self._stream_piper_voice(text)
+            if self.barge_in:
+                self.barge_in.deactivate()
+            self.is_speaking = False
+            self.emit_status("idle")
 
-    def log_and_speak(self, text):
+    def log_and_speak(self, text, priority=PRIORITY_NORMAL):
         """
         Print to console and queue the text for speech output.
+        Arg: priority - PRIORITY_ALERT jumps ahead of normal replies.
         """
         self.emit_log(text)
         
@@ -389,24 +596,26 @@ class JarvisAssistant:
         self.last_spoken_text = text
         self.last_spoken_time = current_time
 
-        with self.lock:
-            self.speech_queue.append(text)
+        self._queue_speech(text, priority)
+
+    def _queue_speech(self, text, priority=PRIORITY_NORMAL, ttl=-1):
+        """Queue text for speech without logging it (respects silent mode)."""
+        if getattr(self.thread_local, 'silent', False):
+            return
+        self.speech_queue.put(text, priority=priority, ttl=ttl)
 
     def stop_speaking(self):
         """
-        Immediately terminates the speech process and clears the queue.
+        Immediately cuts off playback (the output stream stays open) and clears the queue.
         """
-        with self.lock:
-            self.speech_queue.clear()
+        self.speech_interrupts += 1
+        self.speech_queue.clear()
         
-        if self.speech_process:
+        if self.audio_sink:
             try:
-                self.speech_process.terminate()
-                self.speech_process.kill()
+                self.audio_sink.interrupt()
             except Exception as e:
                 print(f"[jarvis] Error stopping speech: {e}")
-            finally:
-                self.speech_process = None
         
         self.is_speaking = False
         self.emit_status("idle")
@@ -591,7 +800,7 @@ class JarvisAssistant:
                     if alert_needed:
                         # Send desktop notification as well
                         self.send_notification("System Alert", " ".join(msg_parts))
-                        self.log_and_speak("Alert. " + " ".join(msg_parts))
+                        self.log_and_speak("Alert. " + " ".join(msg_parts), priority=PRIORITY_ALERT)
                         # Wait longer if we just spoke an alert to avoid spamming (e.g., 5 minutes)
                         time.sleep(300) 
                         continue
@@ -602,10 +811,23 @@ class JarvisAssistant:
             # Check every 2 minutes
             time.sleep(120)
 
+    def _make_endpointer(self):
+        """
+        Build the endpointer for one command recording.
+        With endpointing disabled this degrades to the classic fixed 3.5s window.
+        """
+        if not self.endpointing_enabled:
+            return VoiceActivityEndpointer(min_duration=3.5, max_duration=3.5, no_speech_timeout=3.5, hangover=3.5)
+        return VoiceActivityEndpointer(
+            hangover=self.endpoint_hangover,
+            min_duration=self.command_min_duration,
+            max_duration=self.command_max_duration,
+        )
+
     def listen(self):
         """
-        Record exactly 3.5 seconds of audio and process it.
-        Just like the 'First Edition' protocol Sir preferred.
+        Wait for the wake word, then record the command until the VAD endpointer
+        detects the end of speech (or the max duration is hit), and transcribe it.
         """
         if not self.vosk_model:
             return None
@@ -614,86 +836,134 @@ class JarvisAssistant:
             self.emit_status("listening")
             self.emit_log("Awaiting Wake Word...")
 
-            # Open stream
-            stream = self.p.open(format=pyaudio.paInt16, channels=1, rate=16000, input=True, frames_per_buffer=8000)
-            stream.start_stream()
+            # Read from the always-on capture ring, starting at the live edge
+            capture = self.mic_capture
+            cursor = capture.cursor()
+            timings = self.listen_timings = {}
+            stage_start = time.perf_counter()
 
             # --- PHASE 1: WAKE WORD DETECTION ---
             wake_word_detected = False
-            self.vosk_recognizer.Reset()
+            gate_open = False
+            self.wake_recognizer.Reset()
             
             while True:
-                data = stream.read(4000, exception_on_overflow=False)
-                if len(data) == 0: continue
+                view, cursor = capture.read(cursor, 4000)
+                if len(view) == 0:
+                    if not capture.running: return None
+                    continue
+
+                # Low-power mode: silent chunks never reach Kaldi
+                if self.wake_low_power:
+                    if not self.wake_gate.process(view):
+                        gate_open = False
+                        continue
+                    if not gate_open:
+                        # Gate just opened: catch up on the look-back window too
+                        gate_open = True
+                        lookback = int(self.wake_lookback * 16000)
+                        view, _ = capture.read(cursor - len(view) - lookback, len(view) + lookback, timeout=0)
+
+                data = view.tobytes() # Vosk's C binding needs a bytes object
                 
                 # Check Partial Result for speed
-                if self.vosk_recognizer.AcceptWaveform(data):
-                    res = json.loads(self.vosk_recognizer.Result())
-                    if "jarvis" in res.get("text", "").lower():
-                        wake_word_detected = True
-                        break
-                else:
-                    partial = json.loads(self.vosk_recognizer.PartialResult())
-                    if "jarvis" in partial.get("partial", "").lower():
-                        wake_word_detected = True
-                        break
+                with self.wake_decode_stats.measure():
+                    if self.wake_recognizer.AcceptWaveform(data):
+                        heard = json.loads(self.wake_recognizer.Result()).get("text", "")
+                    else:
+                        heard = json.loads(self.wake_recognizer.PartialResult()).get("partial", "")
+                if "jarvis" in heard.lower():
+                    wake_word_detected = True
+                    break
             
-            # --- PHASE 2: COMMAND RECORDING (3.5s) ---
+            # --- PHASE 2: COMMAND RECORDING (VAD Endpointing) ---
             if wake_word_detected:
-                self.emit_log("Wake Word Detected! Recording Command (3.5s)...")
+                timings["wake"] = time.perf_counter() - stage_start
+                stage_start = time.perf_counter()
+                self.emit_log("Wake Word Detected! Recording Command...")
+                if self.wake_low_power:
+                    gate_stats = self.wake_gate.stats
+                    print(f"[jarvis] Wake gate: {gate_stats['decoded']} chunks decoded, {gate_stats['skipped']} skipped.")
+                print(f"[jarvis] {self.wake_decode_stats.summary()} | {self.command_decode_stats.summary()}")
                 self.emit_status("active")
                 
-                start_time = time.time()
-                frames = []
+                endpointer = self._make_endpointer()
+                command_buffer = self.command_buffer
+                command_buffer.reset()
+
+                # Rewind by the pre-roll so words spoken right after "jarvis" are kept.
+                # The pre-roll still holds the tail of the wake word, so the endpointer only
+                # starts at the live edge; otherwise "jarvis" counts as speech onset and a pause
+                # before the command ends the recording early.
+                vad_start = capture.cursor()
+                cursor = capture.cursor(preroll=self.capture_preroll)
+                
+                # Streaming dispatch needs the warm command recognizer; skip it if still loading
+                fast_path = self.streaming_dispatch and self.command_recognizer is not None
+                if fast_path:
+                    with self.vosk_lock:
+                        self.command_recognizer.Reset()
+                last_phrase = None
                 
-                # Record for exactly 3.5 seconds
-                # Optimization: We do NOT process with Vosk here to save CPU/Latency
-                # We just capture the raw boosted audio.
-                while (time.time() - start_time) < 3.5:
-                    data = stream.read(4000, exception_on_overflow=False)
-                    if len(data) > 0:
-                        # Apply software gain boost (2.5x)
-                        audio_data = np.frombuffer(data, dtype=np.int16)
-                        audio_boosted = np.clip(audio_data * 2.5, -32768, 32767).astype(np.int16)
-                        frames.append(audio_boosted.tobytes())
-
-                stream.stop_stream()
-                stream.close()
+                # Record until the endpointer reports trailing silence or a hard limit
+                while True:
+                    audio_data, cursor = capture.read(cursor, self.command_chunk_frames)
+                    if len(audio_data) == 0:
+                        if not capture.running: return None
+                        continue
+
+                    # Apply software gain boost (2.5x), saturating, straight into the capture buffer
+                    audio_boosted = command_buffer.append(audio_data)
+
+                    # Commit early once a fast-path phrase is stable across two partials
+                    if fast_path:
+                        phrase = self._partial_command(audio_boosted.tobytes())
+                        if (phrase in self.FAST_PATH_PHRASES and phrase == last_phrase
+                                and phrase not in self.FAST_PATH_EXTENDABLE):
+                            timings["record"] = time.perf_counter() - stage_start
+                            self.emit_log(f"Fast-Path Heard: '{phrase}'", user=True)
+                            return phrase
+                        if phrase:
+                            last_phrase = phrase
+
+                    # VAD runs on the raw mic signal so thresholds match replayed recordings
+                    vad_audio = audio_data[max(0, vad_start - (cursor - len(audio_data))):]
+                    if (len(vad_audio) and endpointer.process(vad_audio)) or command_buffer.full:
+                        break
+
+                timings["record"] = time.perf_counter() - stage_start
+                stage_start = time.perf_counter()
+                if endpointer.endpoint_time is not None:
+                    self.emit_log(f"Endpoint at {endpointer.endpoint_time:.2f}s ({endpointer.reason}).")
+                else: # Command buffer filled up before the endpointer decided
+                    self.emit_log(f"Recording limit reached at {endpointer.elapsed:.2f}s.")
+                if endpointer.reason == "no_speech":
+                    return None
+
+                # The utterance ended on a fast-path phrase, so nothing followed it: skip transcription
+                if fast_path and endpointer.reason == "silence" and last_phrase in self.FAST_PATH_PHRASES:
+                    self.emit_log(f"Fast-Path Heard: '{last_phrase}'", user=True)
+                    return last_phrase
 
                 self.emit_log("Processing Command...")
-                full_buffer = b"".join(frames)
+                full_buffer = command_buffer.pcm()
 
-                # AUDIO GATE: Check RMS
-                audio_np = np.frombuffer(full_buffer, dtype=np.int16)
-                if np.sqrt(np.mean(audio_np.astype(np.float32)**2)) < 100:
+                # AUDIO GATE: Check RMS (accumulated while recording)
+                gated = command_buffer.rms < 100
+                timings["gate"] = time.perf_counter() - stage_start
+                stage_start = time.perf_counter()
+                if gated:
                     return None
 
-                # METHOD 1: Google Web Speech (Fast/Accurate Cloud)
-                try:
-                    # Convert raw 16kHz 16-bit mono to AudioData
-                    audio_source = sr.AudioData(full_buffer, 16000, 2)
-                    # Use Google's API (default key is fine for testing)
-                    text = self.recognizer.recognize_google(audio_source)
-                    self.emit_log(f"Google Heard: '{text}'", user=True)
-                    result = self._sanitize_command(text)
-                    if result:
-                        return result
-                except sr.UnknownValueError:
-                    pass # Google didn't understand
-                except sr.RequestError:
-                    print("[jarvis] Google STT Unreachable.")
-                except Exception as e:
-                    print(f"[jarvis] Google STT Error: {e}")
-
-                # METHOD 2: Vosk (Local Fallback)
-                self.emit_log("Falling back to local neural engine...")
-                self.vosk_recognizer.Reset()
-                self.vosk_recognizer.AcceptWaveform(full_buffer)
-                res = json.loads(self.vosk_recognizer.Result())
-                text = res.get("text", "")
-                
-                self.emit_log(f"Vosk Heard: '{text}'", user=True)
-                return self._sanitize_command(text)
+                # Race Google (cloud) and Vosk (local) on the same buffer
+                engines = [("vosk", lambda cancel: self._transcribe_vosk(full_buffer, cancel), self.stt_deadlines["vosk"])]
+                if self.cloud_stt_enabled:
+                    engines.insert(0, ("google", lambda cancel: self._transcribe_google(full_buffer, cancel), self.stt_deadlines["google"]))
+                engine, command = self.stt_race.run(engines, self._sanitize_command, self.stt_min_confidence)
+                timings["stt"] = time.perf_counter() - stage_start
+                if engine:
+                    print(f"[jarvis] STT winner: {engine}")
+                return command
             
             return None
             
@@ -705,6 +975,74 @@ class JarvisAssistant:
             print(f"[jarvis] Local Listener Error: {e}")
             return None
 
+    def _transcribe_google(self, full_buffer, cancel):
+        """
+        Google Web Speech (Fast/Accurate Cloud). Returns (text, confidence).
+        """
+        try:
+            # Convert raw 16kHz 16-bit mono to AudioData
+            audio_source = sr.AudioData(full_buffer, 16000, 2)
+            # Use Google's API (default key is fine for testing)
+            result = self.recognizer.recognize_google(audio_source, show_all=True)
+        except sr.UnknownValueError:
+            return None, None # Google didn't understand
+        except sr.RequestError:
+            print("[jarvis] Google STT Unreachable.")
+            return None, None
+
+        if cancel.is_set() or not isinstance(result, dict) or not result.get("alternative"):
+            return None, None
+
+        best = result["alternative"][0]
+        text = best.get("transcript", "")
+        self.emit_log(f"Google Heard: '{text}'", user=True)
+        return text, best.get("confidence")
+
+    def _get_command_recognizer(self):
+        """
+        Return the warm full-vocabulary command recognizer, creating it on first use.
+        """
+        with self.vosk_lock:
+            if self.command_recognizer is None:
+                recognizer = vosk.KaldiRecognizer(self.vosk_model, 16000)
+                recognizer.SetWords(True) # Per-word confidence for the STT race
+                self.command_recognizer = recognizer
+            return self.command_recognizer
+
+    def _partial_command(self, chunk):
+        """
+        Feed one capture chunk to the command recognizer and return the current
+        hypothesis, normalized and stripped of the wake word.
+        """
+        with self.vosk_lock, self.command_decode_stats.measure():
+            if self.command_recognizer.AcceptWaveform(chunk):
+                text = json.loads(self.command_recognizer.Result()).get("text", "")
+            else:
+                text = json.loads(self.command_recognizer.PartialResult()).get("partial", "")
+        return " ".join(text.lower().replace("jarvis", "").split())
+
+    def _transcribe_vosk(self, full_buffer, cancel):
+        """
+        Vosk (Local) decode, fed in 250ms slices so a lost race stops promptly.
+        Returns (text, mean word confidence).
+        """
+        step = 8000 # 4000 frames of int16
+        recognizer = self._get_command_recognizer()
+        with self.vosk_lock, self.command_decode_stats.measure():
+            recognizer.Reset()
+            for offset in range(0, len(full_buffer), step):
+                if cancel.is_set():
+                    return None, None
+                # Vosk's C binding needs bytes, so only the 250ms slice is copied
+                recognizer.AcceptWaveform(bytes(full_buffer[offset:offset + step]))
+            res = json.loads(recognizer.FinalResult())
+
+        text = res.get("text", "")
+        words = res.get("result") or []
+        confidence = sum(w.get("conf", 0) for w in words) / len(words) if words else None
+        self.emit_log(f"Vosk Heard: '{text}'", user=True)
+        return text, confidence
+
     def retrieve_intel(self, url):
         """
         Use BeautifulSoup to fetch a URL and strip specific text.
@@ -755,30 +1093,10 @@ class JarvisAssistant:
             self.log_and_speak("There was an error with the web driver.")
 
     def _init_db(self):
-        """Initialize the SQLite database schema."""
+        """Open the memory store (persistent per-thread connections) and ensure the schema."""
+        self.memory = MemoryStore(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            # History table for raw transcripts
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS conversation_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    user_text TEXT,
-                    assistant_text TEXT,
-                    intent TEXT
-                )
-            ''')
-            # Memory table for extracted "facts" or key settings (Future proofing)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_memory (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            conn.commit()
-            conn.close()
+            self.memory.init_schema()
             self.emit_log("Neural Database (SQLite) Online.")
         except Exception as e:
             print(f"[jarvis] Database initialization error: {e}")
@@ -794,24 +1112,13 @@ class JarvisAssistant:
                 if not history:
                     return
 
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                
                 # Check if already migrated
-                cursor.execute("SELECT COUNT(*) FROM conversation_history")
-                if cursor.fetchone()[0] > 0:
-                    conn.close()
+                if self.memory.history_count() > 0:
                     return
 
                 print(f"[jarvis] Migrating {len(history)} memories to SQL...")
-                for entry in history:
-                    cursor.execute('''
-                        INSERT INTO conversation_history (timestamp, user_text, assistant_text)
-                        VALUES (?, ?, ?)
-                    ''', (entry.get("timestamp"), entry.get("user"), entry.get("assistant")))
-                
-                conn.commit()
-                conn.close()
+                self.memory.import_turns([(entry.get("timestamp"), entry.get("user"), entry.get("assistant"))
+                                          for entry in history])
                 print("[jarvis] Migration complete. JSON archived.")
                 # Rename to backup instead of deleting
                 os.rename(json_path, json_path + ".bak")
@@ -823,22 +1130,14 @@ class JarvisAssistant:
         Load recent history from SQLite.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_text, assistant_text, timestamp FROM conversation_history 
-                ORDER BY timestamp DESC LIMIT ?
-            ''', (limit,))
-            rows = cursor.fetchall()
-            conn.close()
-            
             # Convert to list of dicts for compatibility
             history = []
-            for row in reversed(rows):
+            for row in self.memory.recent_history(limit):
                 history.append({
                     "user": row[0],
                     "assistant": row[1],
-                    "timestamp": row[2]
+                    "timestamp": row[2],
+                    "intent": row[3]
                 })
             return history
         except Exception as e:
@@ -850,11 +1149,7 @@ class JarvisAssistant:
         Store a persistent fact in system_memory.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR REPLACE INTO system_memory (key, value) VALUES (?, ?)", (key, value))
-            conn.commit()
-            conn.close()
+            self.memory.store_fact(key, value)
             print(f"[jarvis] Memory Stored: [{key}] -> {value}")
             return True
         except Exception as e:
@@ -866,80 +1161,51 @@ class JarvisAssistant:
         Search both conversation history and system memory for relevant context.
         Uses a simple keyword search strategy for speed.
         """
+        facts, history_matches = self._search_memory(query, limit)
+        memory_context, _ = ContextBudget(self.context_token_budget).assemble(facts, (), history_matches)
+        return memory_context
+
+    def _search_memory(self, query, limit=5):
+        """
+        Raw rows behind retrieve_memory_context(): (facts, history_matches).
+        Facts are capped too, so a huge system_memory table can't flood the caller.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # 1. Search System Memory (Facts) - Weighted higher
-            cursor.execute("SELECT key, value FROM system_memory WHERE key LIKE ? OR value LIKE ?", (f'%{query}%', f'%{query}%'))
-            facts = cursor.fetchall()
+            facts = self.memory.search_facts(query, self.max_fact_rows)
             
             # 2. Search Conversation History (Episodic)
             # Remove common stop words for better keyword matching
             stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'is', 'are', 'was', 'were'}
             keywords = [w for w in query.split() if w.lower() not in stop_words and len(w) > 3]
-            history_matches = []
-            
-            if keywords:
-                # Build a dynamic query for keywords
-                conditions = " OR ".join(["user_text LIKE ? OR assistant_text LIKE ?"] * len(keywords))
-                params = []
-                for k in keywords:
-                    params.extend([f'%{k}%', f'%{k}%'])
-                
-                # Exclude very recent history (last 5) to avoid duplication with short-term context
-                sql = f"SELECT user_text, assistant_text, timestamp FROM conversation_history WHERE ({conditions}) ORDER BY timestamp DESC LIMIT ?"
-                params.append(limit)
-                
-                cursor.execute(sql, tuple(params))
-                history_matches = cursor.fetchall()
-            
-            conn.close()
-            
-            context = []
-            if facts:
-                context.append("RELEVANT FACTS:")
-                for k, v in facts:
-                    context.append(f"- {k}: {v}")
-            
-            if history_matches:
-                context.append("RELEVANT PAST CONVERSATIONS:")
-                for row in history_matches:
-                    context.append(f"[{row[2]}] User: {row[0]} | Jarvis: {row[1]}")
-            
-            return "\n".join(context)
+            history_matches = self.memory.search_episodes(keywords, limit)
+            return facts, history_matches
             
         except Exception as e:
             print(f"[jarvis] Memory retrieval error: {e}")
-            return ""
+            return [], []
 
     def save_history(self, user_text, assistant_text, intent=None):
         """
         Save a new interaction to the SQLite database.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO conversation_history (user_text, assistant_text, intent)
-                VALUES (?, ?, ?)
-            ''', (user_text, assistant_text, intent))
-            conn.commit()
-            conn.close()
+            self.memory.save_turn(user_text, assistant_text, intent)
         except Exception as e:
             print(f"[jarvis] History save error: {e}")
+        self.conversation.append(Turn(user_text, assistant_text, intent))
+
+    def recent_turns(self, limit=5):
+        """Last `limit` turns from the in-process window (no disk I/O)."""
+        return self.conversation.recent(limit)
 
     def clear_history_db(self):
         """
         Wipe all memory.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM conversation_history")
-            cursor.execute("DELETE FROM system_memory")
-            conn.commit()
-            conn.close()
+            self.memory.clear()
+            self.conversation.clear()
             self.emit_log("NEURAL MEMORY WIPED.")
             return True
         except Exception as e:
@@ -962,189 +1228,266 @@ class JarvisAssistant:
             output.append(f"[{ts}]\nUser: {user}\njarvis: {assistant}\n")
         return "\n".join(output)
 
-    def ask_ai(self, prompt, system_instruction=None, json_mode=False, include_history=False):
+    def _build_messages(self, prompt, system_instruction=None, include_history=False):
         """
-        Send a prompt to local Ollama instance and return the AI's response.
-        Arg: json_mode (bool) - If True, enforces JSON output from the model.
-        Arg: include_history (bool) - If True, appends last 5 conversation turns from SQL context.
+        Assemble the chat messages for an Ollama request.
+        Static persona first, then recent turns, then volatile context (clock, memory),
+        so the prompt prefix stays identical between calls and Ollama can reuse it.
         """
+        context_blocks = []
         if not system_instruction:
             current_clock = time.strftime("%I:%M %p")
             current_date = time.strftime("%A, %B %d, %Y")
-            system_instruction = f"""
-            You are jarvis., a highly advanced AI developed by Justin.
-            REAL-TIME CONTEXT: Today is {current_date}. The current time is {current_clock}.
-            
-            Personality: British, sophisticated, slightly dry wit, loyal, and highly efficient. 
-            Tone: Professional, calm, and brilliant. Call the user 'Sir'.
-            
-            Current Core Architecture:
-            - Neural Memory: Local SQLite Database (jarvis_memory.db).
-            - Speech Engine: 100% Local Neural Engine (Vosk/Piper). No cloud dependencies for voice.
-            - Visual Protocols: Capable of taking, sending, and deleting screenshots.
-            - Efficiency: Running in Eco-Efficient mode (optimized polling).
-            
-            Contextual Awareness: You have access to the last 5 conversation turns from your neural memory.
-            Constraints: Never call yourself J.A.R.V.I.S. or mention Iron Man. 
-            Do NOT output internal thoughts or JSON metadata. Speak ONLY natural dialogue.
-            """
-
-        # Prepare messages
-        messages = [{"role": "system", "content": system_instruction}]
+            context_blocks.append(f"REAL-TIME CONTEXT: Today is {current_date}. The current time is {current_clock}.")
 
-        # Inject Memory Context (Long-Term)
-        if include_history and len(prompt) > 5:
-            memory_context = self.retrieve_memory_context(prompt)
+        history = []
+        if include_history:
+            # Long-term memory plus the last 5 interactions, fitted to a fixed token budget
+            # (facts > recent turns > episodic matches) so prompt size can't grow with the DB
+            facts, episodes = self._search_memory(prompt) if len(prompt) > 5 else ([], [])
+            budget = ContextBudget(self.context_token_budget)
+            turns = [turn.as_dict() for turn in self.recent_turns(limit=5)]
+            memory_context, history = budget.assemble(facts, turns, episodes)
+            if budget.dropped:
+                print(f"[jarvis] Context budget ({budget.max_tokens} tokens) dropped: {', '.join(budget.dropped)}")
             if memory_context:
-                messages.append({"role": "system", "content": f"MEMORY CONTEXT (Use this to inform your response):\n{memory_context}"})
+                context_blocks.append(f"MEMORY CONTEXT (Use this to inform your response):\n{memory_context}")
 
-        # Inject Context (Last 5 interactions from SQL) if enabled
-        if include_history:
-            history = self.load_history(limit=5)
-            for item in history:
-                if item.get("user"):
-                    messages.append({"role": "user", "content": item.get("user")})
-                if item.get("assistant"):
-                    messages.append({"role": "assistant", "content": item.get("assistant")})
+        return self.prompt_builder.build(prompt, system_instruction, history, context_blocks)
 
-        messages.append({"role": "user", "content": prompt})
+    def _record_llm_stats(self, result):
+        """
+        Keep Ollama's prompt-eval numbers from the last reply. A small prompt_eval_count
+        on repeat calls means the cached prefix is being reused.
+        """
+        count = result.get("prompt_eval_count")
+        duration = result.get("prompt_eval_duration")
+        if count is None:
+            return
+        self.llm_stats = {
+            "prompt_eval_count": count,
+            "prompt_eval_ms": (duration or 0) / 1e6,
+            "eval_count": result.get("eval_count"),
+            "total_ms": (result.get("total_duration") or 0) / 1e6,
+        }
+        print(f"[jarvis] Prompt eval: {count} tokens in {self.llm_stats['prompt_eval_ms']:.0f}ms")
+
+    def ask_ai(self, prompt, system_instruction=None, json_mode=False, include_history=False, cache=False):
+        """
+        Send a prompt to local Ollama instance and return the AI's response.
+        Arg: json_mode (bool) - If True, enforces JSON output from the model.
+        Arg: include_history (bool) - If True, appends last 5 conversation turns from SQL context.
+        Arg: cache (bool) - If True, serve/store the reply in the response cache. Only for
+             calls that are pure functions of their input.
+        """
+        messages = self._build_messages(prompt, system_instruction, include_history)
+
+        cache_key = None
+        if cache and self.response_cache:
+            cache_key = ResponseCache.key(self.model, messages, {"json": json_mode})
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-        url = "http://localhost:11434/api/chat"
-        
         data = {
             "model": self.model,
             "messages": messages,
-            "stream": False
+            "stream": False,
+            "keep_alive": self.llm_keep_alive
         }
         
         if json_mode:
             data["format"] = "json"
 
-        # Try up to 2 times in case of temporary 500 errors
-        for attempt in range(2):
+        # Retries with backoff (for temporary 500s) happen inside the client's event loop
+        try:
+            result = self.llm_client.chat(data, deadline=self.llm_deadline)
+        except ConnectionError:
+            return "I cannot connect to my local neural core."
+        except Exception as e:
+            print(f"[jarvis] AI Error: {e}")
+            return "I encountered a processing error, Sir. My neural core seems slightly unstable."
+
+        self._record_llm_stats(result)
+        full_response = result.get('message', {}).get('content', "")
+
+        if json_mode:
+            full_cleaned = full_response.strip()
+        else:
+            # Final cleanup for the full response to remove any stray JSON blocks
+            full_cleaned = re.sub(r'\{.*?\}', '', full_response, flags=re.DOTALL).strip()
+            if not full_cleaned: full_cleaned = full_response
+
+        if cache_key:
+            self.response_cache.put(cache_key, full_cleaned)
+        return full_cleaned
+
+    def ask_ai_stream(self, prompt, system_instruction=None, include_history=False):
+        """
+        Streaming variant of ask_ai(). Reads Ollama's NDJSON chunks as they arrive,
+        pushes token deltas to the Web UI and feeds each finished sentence into one
+        speech session, so synthesis runs ahead across sentences. Stops reading if the
+        user interrupts (barge-in / stop_speaking()). Returns the cleaned reply.
+        """
+        messages = self._build_messages(prompt, system_instruction, include_history)
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.llm_keep_alive
+        }
+
+        stream_id = f"ai-{time.time_ns()}"
+        cleaner = StreamCleaner()
+        sentences = SentenceAccumulator()
+        silent = getattr(self.thread_local, 'silent', False)
+        interrupts = self.speech_interrupts
+        speech = SpeechStream(self.audio_sink.generation if self.audio_sink else 0)
+        queued = False
+
+        def speak(text):
+            nonlocal queued
+            if silent:
+                return
+            speech.feed(text)
+            if not queued:
+                self._queue_speech(speech, ttl=None) # Part of a live reply; never stale
+                queued = True
+
+        interrupted = False
+        try:
             try:
-                response = self.session.post(url, json=data, timeout=30)
-                
-                if response.status_code == 500 and attempt == 0:
-                    print("[jarvis] AI Core stalling. Attempting recovery...")
-                    time.sleep(1) # Brief pause before retry
-                    continue
-                    
-                response.raise_for_status()
-                result = response.json()
-                full_response = result['message']['content']
-                
-                if json_mode:
-                    return full_response.strip()
+                for chunk in self.llm_client.stream(data, deadline=self.llm_deadline):
+                    if not silent and self.speech_interrupts != interrupts:
+                        interrupted = True
+                        break # User cut in: stop generating, the rest would not be spoken
+                    text = cleaner.feed(chunk.get("message", {}).get("content", ""))
+                    if text:
+                        self.emit_log_delta(stream_id, text)
+                        for sentence in sentences.feed(text):
+                            speak(sentence)
+                    if chunk.get("done"):
+                        self._record_llm_stats(chunk)
+                        break
+            except ConnectionError:
+                msg = "I cannot connect to my local neural core."
+                self.log_and_speak(msg)
+                return msg
+            except Exception as e:
+                print(f"[jarvis] AI Stream Error: {e}")
+                if not cleaner.raw:
+                    msg = "I encountered a processing error, Sir. My neural core seems slightly unstable."
+                    self.log_and_speak(msg)
+                    return msg
 
-                # Final cleanup for the full response to remove any stray JSON blocks
-                import re
-                full_cleaned = re.sub(r'\{.*?\}', '', full_response, flags=re.DOTALL).strip()
-                if not full_cleaned: full_cleaned = full_response
-                
+            if interrupted:
+                full_cleaned = cleaner.text.strip()
+                print(f"[jarvis] Reply interrupted: {full_cleaned}")
                 return full_cleaned
 
-            except requests.exceptions.ConnectionError:
-                return "I cannot connect to my local neural core."
-            except Exception as e:
-                if attempt == 1: # Only report on the last attempt
-                    print(f"[jarvis] AI Error: {e}")
-                    return "I encountered a processing error, Sir. My neural core seems slightly unstable."
-                time.sleep(1)
-        
-        return "System logic error."
+            text = cleaner.flush() # A "{" that never closed was prose after all
+            if text:
+                self.emit_log_delta(stream_id, text)
+                for sentence in sentences.feed(text):
+                    speak(sentence)
+
+            tail = sentences.flush()
+            if tail:
+                speak(tail)
+
+            full_cleaned = cleaner.text.strip()
+            if not full_cleaned:
+                # Reply was nothing but a JSON block: fall back to the raw text, like ask_ai()
+                full_cleaned = cleaner.raw.strip()
+                if full_cleaned:
+                    self.emit_log_delta(stream_id, full_cleaned)
+                    speak(full_cleaned)
+        finally:
+            speech.close()
+            self.emit_log_delta(stream_id, "", end=True)
+
+        print(f"[jarvis] {full_cleaned}")
+        return full_cleaned
 
     def determine_intent(self, command):
         """
         Analyze the user's intent using a two-stage approach:
         1. Fast Regex (Zero Latency) for trivial commands and common queries.
         2. "Dual-Mode Brain" (LLM) to decide between DIRECT_ACTION and AGENTIC_FLOW.
+        Keyword checks share one compiled scan (INTENT_ROUTER); the stages below only
+        decide which of the hit rules wins. Misses are tried against INTENT_CLASSIFIER
+        before falling back to the LLM.
         """
         # --- STAGE 0: PRIORITY INTERCEPTS ---
         command_lower = command.lower().strip()
+        hits = self.INTENT_ROUTER.match(command_lower)
         
         # Priority: Check for Confirmation State
         if self.pending_confirmation:
-            if any(w in command_lower for w in ["yes", "confirm", "proceed", "do it"]):
+            if "confirm_yes" in hits:
                 return {"action": "confirmation", "response": "confirmed"}
-            if any(w in command_lower for w in ["no", "cancel", "abort", "stop"]):
+            if "confirm_no" in hits:
                 return {"action": "confirmation", "response": "cancelled"}
         
         # Priority: Delete commands (Must override "screenshot" keyword matches)
         # Using more specific keywords to avoid "screenshot" falling through to "take"
-        if any(w in command_lower for w in ["delete", "remove", "clear", "trash", "wipe"]):
+        if "delete" in hits:
             # 1. Explicit Memory Wipe
-            if "memory" in command_lower or "memories" in command_lower or "history" in command_lower or "database" in command_lower:
+            if "memory_target" in hits:
                  return {"action": "memory", "sub_action": "clear_all_request"}
 
             # 2. Explicit request
-            if "screenshot" in command_lower or "photo" in command_lower or "image" in command_lower:
+            if "visual_target" in hits:
                  return {"action": "screenshot", "sub_action": "delete_latest"}
 
             # 2. Contextual request ("delete it", "delete that")
-            if any(w in command_lower for w in ["it", "that", "this"]):
-                history = self.load_history(limit=5)
+            if "contextual" in hits:
+                history = self.recent_turns(limit=5)
                 if history:
                     # Look for the last interaction that involved a visual
-                    for item in reversed(history):
-                        resp = item.get("assistant", "")
-                        if "SCREENSHOT:" in resp or "Screenshot taken" in resp or "Photo caught" in resp:
+                    for turn in reversed(history):
+                        if turn.has_visual:
                              return {"action": "screenshot", "sub_action": "delete_latest"}
                     
                     # Fallback to the very last one if the above check is too strict
                     return {"action": "screenshot", "sub_action": "delete_latest"}
 
         # Priority: Telegram Visual Transmission
-        if any(w in command_lower for w in ["send image", "send photo", "send the image", "send the screenshot", "transmit photo"]):
+        if "telegram_send" in hits:
              return {"action": "telegram", "sub_action": "send_latest_screenshot"}
 
         # --- STAGE 0.5: HYPER-FAST CACHE ---
-        FAST_CACHE = {
-            "battery": {"action": "system_stats"},
-            "cpu": {"action": "system_stats"},
-            "percentage": {"action": "system_stats"},
-            "status": {"action": "system_stats"},
-            # "screenshot": {"action": "screenshot", "sub_action": "take"}, # Moved to regex to avoid override
-            "take photo": {"action": "camera", "sub_action": "capture"},
-            "status report": {"action": "status_report"},
-            "systems check": {"action": "status_report"},
-            "search": {"action": "web", "type": "search", "query": command.replace("search", "").strip()},
-            # Clock Triggers
-            "time": {"action": "clock"},
-            "what time": {"action": "clock"},
-            "current time": {"action": "clock"},
-            "date": {"action": "clock"},
-            "what day": {"action": "clock"},
-        }
-        for key, val in FAST_CACHE.items():
-            if key in command_lower:
-                return val
+        fast = self.INTENT_ROUTER.first(hits, self.FAST_INTENTS)
+        if fast == "fast_search":
+            return {"action": "web", "type": "search", "query": command.replace("search", "").strip()}
+        if fast:
+            return dict(self.FAST_INTENTS[fast])
         
         # Explicit screenshot command check (if not in delete)
-        if command_lower == "screenshot" or "take screenshot" in command_lower or "capture screen" in command_lower:
+        if command_lower == "screenshot" or "screenshot_take" in hits:
              return {"action": "screenshot", "sub_action": "take"}
 
         # --- STAGE 1: FAST REGEX ---
         
         # Volume
-        if any(w in command_lower for w in ["volume", "louder", "quieter", "mute", "silent"]):
-             if "up" in command_lower or "louder" in command_lower: return {"action": "volume", "type": "up"}
-             if "down" in command_lower or "quieter" in command_lower: return {"action": "volume", "type": "down"}
-             if "mute" in command_lower or "silent" in command_lower: return {"action": "volume", "type": "mute"}
+        if "volume" in hits:
+             direction = self.INTENT_ROUTER.first(hits, ("volume_up", "volume_down", "volume_mute"))
+             if direction:
+                 return {"action": "volume", "type": direction[len("volume_"):]}
 
         # Stop
-        if any(w in command_lower for w in ["stop", "cancel", "shh", "wait"]):
+        if "stop" in hits:
              self.stop_speaking()
              return {"action": "chat", "response": "Standing by."}
 
         # System
-        if any(w in command_lower for w in ["shutdown", "quit program", "exit jarvis"]):
+        if "shutdown" in hits:
              return {"action": "system", "type": "shutdown"}
 
         # Identity / Chat
-        if any(p in command_lower.strip("? .") for p in ["who are you", "what is your name", "hello", "hi jarvis", "are you there", "can you hear me"]):
+        if "identity" in hits:
              prompt = f"Reply to: '{command}'. Confirm you hear me and characterize jarvis."
-             return {"action": "ask_ai", "prompt": prompt}
+             return {"action": "ask_ai", "prompt": prompt, "cacheable": True}
 
         # Memory / Facts 
         if command_lower.startswith("remember that ") or command_lower.startswith("save fact "):
@@ -1156,9 +1499,16 @@ class JarvisAssistant:
              return {"action": "app", "name": app_name}
              
         # System Health (Zero Hallucination)
-        if any(w in command_lower for w in ["battery", "cpu", "percentage", "ram", "temp", "health", "system check", "stats"]):
+        if "health" in hits:
              return {"action": "system_stats"}
 
+        # --- STAGE 1.5: EXEMPLAR MATCH ---
+        # Nearest known phrasing of an existing action; no LLM round trip if it is close enough
+        if len(command) >= 6:
+            intent, score = self.INTENT_CLASSIFIER.classify(command_lower)
+            if intent:
+                return dict(intent)
+
         # Default: Optimized Fast Path
         # Skip the complex "Router" LLM call and go straight to the local AI for general questions.
         # Only trigger if the command is substantial enough (6+ chars) to be a request.
@@ -1372,13 +1722,100 @@ class JarvisAssistant:
     def agentic_terminal_action(self, goal, max_steps=10):
         """
         Robust Agentic Loop handling commands, GUI, and simple communication.
+        Plan mode (default): one LLM call returns the whole step list, which runs locally;
+        the model is only consulted again when a step fails. Falls back to step-by-step.
         """
         self.log_and_speak(f"Agentic Mode Engaged. Goal: {goal}")
-        
+        if self.agentic_plan_mode:
+            result = self._agentic_plan_execute(goal, max_steps)
+            if result:
+                return result
+            self.emit_log("No usable plan. Falling back to step-by-step mode.")
+        return self._agentic_step_loop(goal, max_steps)
+
+    def _agentic_plan_execute(self, goal, max_steps):
+        """
+        Plan-then-execute. Returns None if the model never produced a usable plan.
+        """
+        history = ""
+        steps_run = 0
+        for attempt in range(self.agentic_max_replans + 1):
+            plan = self._request_agentic_plan(goal, history, max_steps - steps_run)
+            if not plan:
+                return None if attempt == 0 else self._agentic_give_up()
+            self.emit_log(f"Plan ({len(plan)} steps): " + " -> ".join(s.get("thought", s.get("type", "?")) for s in plan))
+
+            failed = False
+            for step in plan:
+                action_type = str(step.get("type", "")).lower()
+                if action_type == "done":
+                    self.log_and_speak("Task complete.")
+                    return "Task Completed."
+                if steps_run >= max_steps:
+                    # Out of steps with plan still left: the goal was not reached
+                    return self._agentic_give_up()
+                steps_run += 1
+                self.emit_log(f"Step {steps_run}: {step.get('thought', 'Processing...')}")
+                note, ok = self._execute_agentic_step(steps_run, action_type, step.get("value", ""), step.get("wait_for"))
+                history += note
+                if not ok:
+                    self.emit_log(f"Step {steps_run} failed. Re-planning...")
+                    failed = True
+                    break
+
+            if not failed:
+                # Plan ran to the end without an explicit "done"
+                self.log_and_speak("Task complete.")
+                return "Task Completed."
+            if steps_run >= max_steps:
+                break
+
+        return self._agentic_give_up()
+
+    def _agentic_give_up(self):
+        self.log_and_speak("Step limit reached.")
+        return "Step limit reached."
+
+    def _request_agentic_plan(self, goal, history, steps_left):
+        """Ask for the full step list in one round trip. Returns a list of step dicts or None."""
+        system_prompt = f"""
+Goal: {goal}
+
+Completed so far:
+{history[-600:] if history else "None"}
+
+Plan every remaining step (at most {steps_left}) to reach the goal.
+Step types:
+1. "gui" - value format "hotkey:key+key", "type:text", or "press:key"
+2. "terminal" - value is the shell command to execute
+3. "done" - value is "true" (always the last step)
+Optional "wait_for": a process name that must be running before the next step.
+
+Example, to launch Chrome:
+{{"plan": [
+  {{"thought": "start chrome in background", "type": "terminal", "value": "google-chrome &", "wait_for": "chrome"}},
+  {{"thought": "finished", "type": "done", "value": "true"}}
+]}}
+
+If a step above failed, plan a different approach.
+Output ONLY a JSON plan:
+        """
+        response = self.ask_ai("Generate the plan", system_instruction=system_prompt, include_history=False, json_mode=True)
+        try:
+            data = json.loads(response)
+        except Exception:
+            self.emit_log(f"JSON Parse Error: {response[:100]}")
+            return None
+        plan = data.get("plan") if isinstance(data, dict) else data
+        if isinstance(plan, dict):
+            plan = [plan]
+        if not isinstance(plan, list):
+            return None
+        return [s for s in plan if isinstance(s, dict) and s.get("type")] or None
+
+    def _agentic_step_loop(self, goal, max_steps):
+        """Original one-LLM-call-per-step loop."""
         history = "" 
-        import getpass
-        import json
-        current_user = getpass.getuser()
         
         for step_i in range(1, max_steps + 1):
              
@@ -1426,58 +1863,95 @@ Your turn. Output ONLY JSON for step {step_i}:
                  self.log_and_speak("Task complete.")
                  return "Task Completed."
 
-             elif action_type == "gui" and action_val:
-                 try:
-                     if ":" not in action_val:
-                         self.emit_log(f"Invalid GUI value format: {action_val}")
-                         continue
-                         
-                     parts = action_val.split(":", 1)
-                     act = parts[0].lower().strip()
-                     val = parts[1].strip()
-                     
-                     if act == "hotkey":
-                         keys = val.split("+")
-                         self.emit_log(f"Pressing: {' + '.join(keys)}")
-                         pyautogui.hotkey(*keys)
-                         time.sleep(2.0)
-                         history += f"\n[{step_i}] Hotkey: {val}"
-                         
-                     elif act == "type":
-                         self.emit_log(f"Typing: {val[:50]}...")
-                         pyautogui.write(val, interval=0.05)
-                         time.sleep(0.5)
-                         history += f"\n[{step_i}] Typed: {val}"
-                         
-                     elif act == "press":
-                         self.emit_log(f"Pressing key: {val}")
-                         pyautogui.press(val)
-                         time.sleep(0.5)
-                         history += f"\n[{step_i}] Pressed: {val}"
-                     else:
-                         self.emit_log(f"Unknown GUI action: {act}")
-                         
-                 except Exception as e:
-                     self.emit_log(f"GUI Error: {e}")
-                     history += f"\n[{step_i}] Error: {e}"
-             
-             elif action_type == "terminal" and action_val:
-                 if str(action_val).strip().lower() != "none":
-                     self.emit_log(f"Executing: {action_val}")
-                     output, code = self.execute_visible_command(action_val)
-                     history += f"\n[{step_i}] Terminal Output: {output[:100]} (Exit Code: {code})"
-                 else:
-                     self.emit_log("AI returned null command. Skipping.")
-                     history += f"\n[{step_i}] Error: Null command received."
+             note, _ = self._execute_agentic_step(step_i, action_type, action_val, data.get("wait_for"))
+             history += note
 
-             else:
-                 self.emit_log(f"Invalid action type: {action_type}")
-                 history += f"\n[{step_i}] Invalid: {thought}"
+        return self._agentic_give_up()
 
-             time.sleep(1.0)
+    def _execute_agentic_step(self, step_i, action_type, action_val, wait_for=None):
+        """
+        Run one gui/terminal step and wait until it has taken effect.
+        Returns (history_note, succeeded).
+        """
+        if action_type == "gui" and action_val:
+            try:
+                if ":" not in action_val:
+                    self.emit_log(f"Invalid GUI value format: {action_val}")
+                    return f"\n[{step_i}] Invalid GUI value: {action_val}", False
+                    
+                parts = action_val.split(":", 1)
+                act = parts[0].lower().strip()
+                val = parts[1].strip()
+                
+                if act == "hotkey":
+                    keys = val.split("+")
+                    self.emit_log(f"Pressing: {' + '.join(keys)}")
+                    before = self._active_window()
+                    pyautogui.hotkey(*keys)
+                    # Hotkeys usually open or switch windows: wait for focus to move instead of a fixed 2s
+                    if before is None or not self._wait_until(lambda: self._active_window() != before, timeout=2.0):
+                        time.sleep(0.3) # No window change to observe; give the target a moment
+                    note = f"\n[{step_i}] Hotkey: {val}"
+                    
+                elif act == "type":
+                    self.emit_log(f"Typing: {val[:50]}...")
+                    pyautogui.write(val, interval=0.05) # Returns once every key is sent
+                    note = f"\n[{step_i}] Typed: {val}"
+                    
+                elif act == "press":
+                    self.emit_log(f"Pressing key: {val}")
+                    pyautogui.press(val)
+                    note = f"\n[{step_i}] Pressed: {val}"
+                else:
+                    self.emit_log(f"Unknown GUI action: {act}")
+                    return f"\n[{step_i}] Unknown GUI action: {act}", False
+                    
+            except Exception as e:
+                self.emit_log(f"GUI Error: {e}")
+                return f"\n[{step_i}] Error: {e}", False
+
+        elif action_type == "terminal" and action_val:
+            if str(action_val).strip().lower() == "none":
+                self.emit_log("AI returned null command. Skipping.")
+                return f"\n[{step_i}] Error: Null command received.", False
+            self.emit_log(f"Executing: {action_val}")
+            output, code = self.execute_visible_command(action_val)
+            note = f"\n[{step_i}] Terminal Output: {output[:100]} (Exit Code: {code})"
+            if code != 0 or self.AGENTIC_FAILURE_PATTERN.search(output or ""):
+                return note, False
 
-        self.log_and_speak("Step limit reached.")
-        return "Step limit reached."
+        else:
+            self.emit_log(f"Invalid action type: {action_type}")
+            return f"\n[{step_i}] Invalid: {action_type}", False
+
+        if wait_for and not self._wait_for_process(wait_for):
+            self.emit_log(f"'{wait_for}' did not start.")
+            return note + f" ('{wait_for}' never started)", False
+        return note, True
+
+    def _wait_until(self, predicate, timeout, interval=0.05):
+        """Poll predicate until it holds or timeout expires. Returns whether it held."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if predicate():
+                return True
+            time.sleep(interval)
+        return False
+
+    def _active_window(self):
+        """X11 id of the focused window (via xdotool), or None if it can't be read."""
+        try:
+            result = subprocess.run(["xdotool", "getactivewindow"], capture_output=True, text=True, timeout=1)
+            return result.stdout.strip() or None
+        except Exception:
+            return None
+
+    def _wait_for_process(self, name, timeout=5.0):
+        """Wait for a process whose name contains `name` to appear."""
+        name = name.lower()
+        return self._wait_until(
+            lambda: any(name in (p.info["name"] or "").lower() for p in psutil.process_iter(["name"])),
+            timeout, interval=0.1)
 
     def _sanitize_command(self, text):
         """
@@ -1508,12 +1982,166 @@ Your turn. Output ONLY JSON for step {step_i}:
         return command if command else None
 
     def execute_visible_command(self, command, timeout=30):
+        """
+        Run a shell command for the agentic loop.
+        Headless by default: output streams to the UI line by line and the exit code comes
+        straight from the process. terminal_mirror also shows the output in a terminal window;
+        terminal_mode = "visible" restores the old terminal-as-transport behaviour.
+        Returns: (output_str, exit_code_int)
+        """
+        if self.terminal_mode == "visible":
+            return self._execute_in_terminal(command, timeout)
+        return self._execute_headless(command, timeout)
+
+    @staticmethod
+    def _drain_pipe(pipe):
+        """Read and discard a pipe until every writer has closed it."""
+        try:
+            os.set_blocking(pipe.fileno(), True)
+            while os.read(pipe.fileno(), 65536):
+                pass
+        except OSError:
+            pass
+        finally:
+            pipe.close()
+
+    def _execute_headless(self, command, timeout=30):
+        """
+        Run the command through bash with stdout+stderr on one pipe, read non-blocking.
+        Keeps at most terminal_output_cap bytes and streams at most terminal_stream_lines lines.
+        """
+        mirror = self._open_terminal_mirror(command) if self.terminal_mirror else None
+        try:
+            proc = subprocess.Popen(["bash", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    stdin=subprocess.DEVNULL, start_new_session=True)
+        except Exception as e:
+            return f"Failed to start command: {e}", 1
+
+        os.set_blocking(proc.stdout.fileno(), False)
+        selector = selectors.DefaultSelector()
+        selector.register(proc.stdout, selectors.EVENT_READ)
+
+        kept = bytearray()
+        pending = b"" # Partial line waiting for its newline
+        truncated = False
+        streamed = 0
+        deadline = time.time() + timeout
+        timed_out = False
+
+        def stream_line(raw):
+            nonlocal streamed
+            if streamed < self.terminal_stream_lines:
+                self.emit_log(f"> {raw.decode(errors='replace').rstrip()}")
+            elif streamed == self.terminal_stream_lines:
+                self.emit_log("> ... (further output not streamed)")
+            streamed += 1
+
+        exited = False
+        eof = False
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    timed_out = not exited
+                    break
+                if not exited and proc.poll() is not None:
+                    # Backgrounded children ("app &") can hold the pipe open forever:
+                    # once bash itself exits, only drain what is already buffered
+                    exited = True
+                    deadline = min(deadline, time.time() + 0.2)
+                if not selector.select(timeout=min(remaining, 0.1)):
+                    continue
+                chunk = os.read(proc.stdout.fileno(), 65536)
+                if not chunk:
+                    eof = True
+                    break # EOF: the command (and anything holding its stdout) has finished
+
+                if mirror:
+                    mirror.write(chunk)
+                    mirror.flush()
+                room = self.terminal_output_cap - len(kept)
+                if room > 0:
+                    kept += chunk[:room]
+                truncated = truncated or len(chunk) > room
+
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    stream_line(line)
+                if len(pending) > 4096: # Don't buffer an endless line (progress bars)
+                    stream_line(pending)
+                    pending = b""
+            if pending:
+                stream_line(pending)
+        finally:
+            selector.close()
+            if timed_out:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except Exception:
+                    pass
+            if eof or timed_out:
+                proc.stdout.close()
+            else:
+                # Background children still write to the pipe: closing it would SIGPIPE them
+                # and leaving it unread would block them once it fills, so keep draining it
+                threading.Thread(target=self._drain_pipe, args=(proc.stdout,), daemon=True).start()
+            code = proc.wait()
+            if mirror:
+                mirror.write(f"\n[exit {124 if timed_out else code}]\n".encode())
+                mirror.close()
+
+        output = kept.decode(errors="replace").strip()
+        if truncated:
+            output += f"\n... (output truncated at {self.terminal_output_cap} bytes)"
+        if timed_out:
+            return (output + "\nCommand timed out.").strip(), 124
+        return output, code
+
+    def _open_terminal_mirror(self, command):
+        """
+        Show a headless command's output in a terminal window. The window tails a temp file
+        that is unlinked straight away, so nothing is left behind. Returns the writable file or None.
+        """
+        try:
+            fd, path = tempfile.mkstemp(prefix="jarvis_mirror_")
+            mirror = os.fdopen(fd, "wb")
+            mirror.write(f"$ {command}\n".encode())
+            mirror.flush()
+            term_cmd = self._terminal_command(f"tail -n +1 -f {shlex.quote(path)}")
+            subprocess.Popen(term_cmd)
+            # Unlink only once tail has the file open
+            self._wait_until(lambda: self._file_opened_elsewhere(path), timeout=2.0)
+            os.unlink(path)
+            return mirror
+        except Exception as e:
+            print(f"[jarvis] Terminal mirror unavailable: {e}")
+            return None
+
+    def _file_opened_elsewhere(self, path):
+        for proc in psutil.process_iter(["name"]):
+            if proc.info["name"] == "tail":
+                try:
+                    if any(f.path == path for f in proc.open_files()):
+                        return True
+                except (psutil.AccessDenied, psutil.NoSuchProcess):
+                    continue
+        return False
+
+    def _terminal_command(self, inner_script):
+        # Prefer mate-terminal (Parrot) -> gnome-terminal -> x-terminal-emulator
+        if shutil.which("mate-terminal"):
+            # mate-terminal requires -x bash -c ... or -- bash -c ...
+            return ["mate-terminal", "--window", "--", "bash", "-c", inner_script]
+        elif shutil.which("gnome-terminal"):
+            return ["gnome-terminal", "--window", "--", "bash", "-c", inner_script]
+        return ["x-terminal-emulator", "-e", f"bash -c '{inner_script}'"]
+
+    def _execute_in_terminal(self, command, timeout=30):
         """
         Launches command in a visible terminal window and captures output/exit code via log file.
         Returns: (output_str, exit_code_int)
         """
-        import shlex
-        
         # Use a unique log file per command invocation to prevent overlap
         timestamp = int(time.time() * 1000)
         log_file = os.path.abspath(f"jarvis_term_{timestamp}.log")
@@ -1537,16 +2165,8 @@ Your turn. Output ONLY JSON for step {step_i}:
         inner_script = f"{{ {command} ; }} 2>&1 | tee {log_file}; echo \"EXIT:$?\" >> {log_file}; echo \"{sentinel}\" >> {log_file}; exec bash"
         
         # Launch Terminal
-        # Prefer mate-terminal (Parrot) -> gnome-terminal -> x-terminal-emulator
         # We use a unique ID to maybe separate windows if possible, but distinct calls usually pop new windows.
-        term_cmd = None
-        if shutil.which("mate-terminal"):
-            # mate-terminal requires -x bash -c ... or -- bash -c ...
-            term_cmd = ["mate-terminal", "--window", "--", "bash", "-c", inner_script]
-        elif shutil.which("gnome-terminal"):
-            term_cmd = ["gnome-terminal", "--window", "--", "bash", "-c", inner_script]
-        else:
-            term_cmd = ["x-terminal-emulator", "-e", f"bash -c '{inner_script}'"]
+        term_cmd = self._terminal_command(inner_script)
             
         try:
             subprocess.Popen(term_cmd)
@@ -1602,6 +2222,7 @@ Your turn. Output ONLY JSON for step {step_i}:
         self.thread_local.silent = silent
         
         try:
+            self.thread_local.last_intent = None
             if not command:
                 return None
 
@@ -1612,6 +2233,7 @@ Your turn. Output ONLY JSON for step {step_i}:
                 return None
                 
             action = intent.get("action")
+            self.thread_local.last_intent = action # Recorded with the turn by save_history()
             
             self.emit_log(f"Identified Intent: {intent.get('action')}")
             if action == "agentic":
@@ -1636,7 +2258,7 @@ Your turn. Output ONLY JSON for step {step_i}:
                     )
 
             elif action == "camera":
-                if intent.get("sub_action") == "take_photo":
+                if intent.get("sub_action") in ("take_photo", "capture"): # Router and exemplars emit "capture"
                     filepath = self.take_photo()
                     if filepath:
                         # Using SCREENSHOT tag to reuse existing Telegram logic
@@ -1660,6 +2282,10 @@ Your turn. Output ONLY JSON for step {step_i}:
                     "- Efficiency: Background cycles throttled for thermal management.",
                     "- Network: Satellite uplink established (Telegram integration)."
                 ]
+                report.append(f"- Speech Queue: {self.speech_queue.summary()}.")
+                if self.speech_cache:
+                    report.append(f"- Speech Cache: {self.speech_cache.summary()}.")
+                report.append(f"- Neural Core: {self.llm_client.summary()}.")
                 stats = self.get_system_health_cached()
                 if stats:
                     report.append(f"- Health: CPU {stats.get('cpu')}% | Temp {stats.get('temp')}C.")
@@ -1762,7 +2388,8 @@ Your turn. Output ONLY JSON for step {step_i}:
                     Example: {{"key": "user_birthday", "value": "User's birthday is on July 7th."}}
                     """
                     try:
-                         json_resp = self.ask_ai(extraction_prompt, json_mode=True)
+                         # Fixed system prompt keeps this call deterministic, so it can be cached
+                         json_resp = self.ask_ai(extraction_prompt, system_instruction="You convert facts into JSON key/value records.", json_mode=True, cache=True)
                          data = json.loads(json_resp)
                          key = data.get("key", "misc_fact")
                          val = data.get("value", fact)
@@ -1826,9 +2453,13 @@ Your turn. Output ONLY JSON for step {step_i}:
                     You are jarvis. Respond concisely, with sophistication and a dry wit. 
                     Address the user as 'Sir'. Never mention J.A.R.V.I.S or Iron Man.
                     """
-                    response = self.ask_ai(prompt, system_instruction=sys_inst, include_history=True)
-                    self.log_and_speak(response)
-                    return response
+                    if intent.get("cacheable"):
+                        # Fixed prompts (identity replies) are answered from the response cache
+                        response = self.ask_ai(prompt, system_instruction=sys_inst, cache=True)
+                        self.log_and_speak(response)
+                        return response
+                    # Streamed: tokens reach the UI and sentences reach the speaker as they arrive
+                    return self.ask_ai_stream(prompt, system_instruction=sys_inst, include_history=True)
 
             elif action == "system_stats":
                 stats = self.get_system_health()
@@ -1938,7 +2569,7 @@ Your turn. Output ONLY JSON for step {step_i}:
                 
                 # Log Interaction to History
                 if response:
-                    self.save_history(command, str(response))
+                    self.save_history(command, str(response), intent=getattr(self.thread_local, 'last_intent', None))
                 
                 # Check for exit condition (based on the processed command)
                 if response == "Powering down system. Goodbye, Sir.":
@@ -0,0 +1,472 @@
+import re
+import json
+import time
+import queue
+import httpx
+import asyncio
+import sqlite3
+import hashlib
+import textwrap
+import threading
+
+
+class StreamCleaner:
+    """
+    Incremental version of ask_ai()'s JSON-stripping cleanup.
+    Feed token deltas; anything inside {...} blocks (tracked by brace depth,
+    so blocks split across tokens are handled) is dropped from the output.
+    Text after an unmatched "{" is held back, but only up to max_hold characters:
+    past that, or at flush(), it is released verbatim as ordinary prose.
+    """
+
+    def __init__(self, max_hold=400):
+        self.depth = 0
+        self.max_hold = max_hold
+        self.held = "" # Text of the open block, from its "{"
+        self.raw = "" # Everything received, for the "reply was only JSON" fallback
+        self.text = "" # Cleaned text emitted so far
+
+    def feed(self, delta):
+        self.raw += delta
+        out = []
+        for ch in delta:
+            if not self.depth:
+                if ch == "{":
+                    self.depth = 1
+                    self.held = ch
+                else:
+                    out.append(ch)
+                continue
+            self.held += ch
+            if ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if not self.depth:
+                    self.held = "" # Closed block: drop it
+            if self.depth and len(self.held) > self.max_hold:
+                out.append(self.held)
+                self.held, self.depth = "", 0
+        cleaned = "".join(out)
+        self.text += cleaned
+        return cleaned
+
+    def flush(self):
+        """Release a block that never closed (end of stream)."""
+        tail, self.held, self.depth = self.held, "", 0
+        self.text += tail
+        return tail
+
+
+class SentenceAccumulator:
+    """
+    Buffers streamed text and releases it one complete sentence at a time.
+    """
+    BOUNDARY = re.compile(r"[.!?](?=\s)")
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        last = None
+        for match in self.BOUNDARY.finditer(self.buffer):
+            last = match
+        if not last:
+            return []
+        ready, self.buffer = self.buffer[:last.end()], self.buffer[last.end():]
+        return [s.strip() for s in re.split(r"(?<=[.!?])\s+", ready) if s.strip()]
+
+    def flush(self):
+        tail, self.buffer = self.buffer.strip(), ""
+        return tail
+
+
+class PromptBuilder:
+    """
+    Assembles Ollama chat messages with a byte-stable prefix.
+    The system prompt comes first and never embeds per-call data; recent turns follow,
+    and volatile material (clock, retrieved memory) goes in a late system message right
+    before the user prompt. Ollama can then reuse its KV cache for the whole prefix.
+    """
+
+    def __init__(self, persona):
+        self.persona = self.normalize(persona)
+
+    @staticmethod
+    def normalize(text):
+        return textwrap.dedent(text).strip()
+
+    def build(self, prompt, system_instruction=None, history=(), context_blocks=()):
+        """
+        history: iterable of {"user": ..., "assistant": ...} dicts, oldest first.
+        context_blocks: volatile strings appended after the history.
+        """
+        system = self.normalize(system_instruction) if system_instruction else self.persona
+        messages = [{"role": "system", "content": system}]
+
+        for item in history:
+            if item.get("user"):
+                messages.append({"role": "user", "content": item["user"]})
+            if item.get("assistant"):
+                messages.append({"role": "assistant", "content": item["assistant"]})
+
+        context = "\n\n".join(block for block in context_blocks if block)
+        if context:
+            messages.append({"role": "system", "content": context})
+
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate for budgeting. Llama-family tokenizers average a little under
+    four characters per token on English; punctuation-heavy text runs denser, so count
+    whichever of chars/4 and words*1.3 is larger.
+    """
+    if not text:
+        return 0
+    return max(len(text) // 4, int(len(text.split()) * 1.3)) + 1
+
+
+class ContextBudget:
+    """
+    Fills a fixed token budget with retrieved context, by priority:
+    facts first, then recent turns (newest first), then episodic matches.
+    Entries longer than `max_entry_tokens` are truncated; whatever no longer fits is
+    dropped and listed in `dropped` so the caller can log it.
+    """
+    TURN_OVERHEAD = 8 # Role headers and separators per user/assistant pair
+
+    def __init__(self, max_tokens=800, max_entry_tokens=120):
+        self.max_tokens = max_tokens
+        self.max_entry_tokens = max_entry_tokens
+        self.used = 0
+        self.dropped = []
+
+    def truncate(self, text, max_tokens=None):
+        max_tokens = max_tokens or self.max_entry_tokens
+        text = text or ""
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        cut = text[:max_tokens * 4]
+        if " " in cut:
+            cut = cut.rsplit(" ", 1)[0]
+        return cut.rstrip() + "..."
+
+    def _take(self, cost, label):
+        if self.used + cost > self.max_tokens:
+            self.dropped.append(label)
+            return False
+        self.used += cost
+        return True
+
+    def assemble(self, facts=(), turns=(), episodes=()):
+        """
+        facts: (key, value) pairs. turns: {"user", "assistant"} dicts, oldest first.
+        episodes: (user_text, assistant_text, timestamp) rows.
+        Returns (memory_context, kept_turns).
+        """
+        self.used = 0
+        self.dropped = []
+
+        fact_lines = []
+        for key, value in facts:
+            line = f"- {key}: {self.truncate(value)}"
+            if self._take(estimate_tokens(line), f"fact '{key}'"):
+                fact_lines.append(line)
+
+        kept_turns = []
+        gap = False # Once a turn is dropped, older ones go too: no holes in the dialogue
+        for turn in reversed(list(turns)):
+            label = f"turn from {turn.get('timestamp', 'unknown')}"
+            if gap:
+                self.dropped.append(label)
+                continue
+            trimmed = {**turn,
+                       "user": self.truncate(turn.get("user")),
+                       "assistant": self.truncate(turn.get("assistant"))}
+            cost = estimate_tokens(trimmed["user"]) + estimate_tokens(trimmed["assistant"]) + self.TURN_OVERHEAD
+            if self._take(cost, label):
+                kept_turns.insert(0, trimmed)
+            else:
+                gap = True
+
+        episode_lines = []
+        for user_text, assistant_text, timestamp in episodes:
+            line = f"[{timestamp}] User: {self.truncate(user_text)} | Jarvis: {self.truncate(assistant_text)}"
+            if self._take(estimate_tokens(line), f"episode from {timestamp}"):
+                episode_lines.append(line)
+
+        context = []
+        if fact_lines:
+            context.append("RELEVANT FACTS:")
+            context.extend(fact_lines)
+        if episode_lines:
+            context.append("RELEVANT PAST CONVERSATIONS:")
+            context.extend(episode_lines)
+        return "\n".join(context), kept_turns
+
+
+class ResponseCache:
+    """
+    Opt-in SQLite cache for deterministic LLM sub-calls.
+    Keyed by model + a hash of the whitespace-normalized messages + request options.
+    Entries expire after `ttl` seconds and the least recently used rows are evicted
+    once the table grows past `max_entries`.
+    """
+
+    def __init__(self, db_path, ttl=7 * 24 * 3600, max_entries=2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model, messages, options=None):
+        normalized = [{"role": m["role"], "content": " ".join(m["content"].split())} for m in messages]
+        payload = json.dumps({"model": model, "messages": normalized, "options": options or {}}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+            self.stats["stores"] += 1
+
+
+class AsyncLLMClient:
+    """
+    Pooled asyncio client for Ollama's /api/chat, shared by every channel (voice, Telegram, Web).
+    - A semaphore caps how many requests Ollama sees at once; the rest wait their turn.
+    - Each call has a deadline covering queueing, retries and the response itself.
+    - 5xx and connection failures are retried with exponential backoff on the event loop,
+      so no worker thread sleeps while waiting.
+    - Identical non-streaming requests already in flight are coalesced onto one HTTP call.
+    The client owns its event loop on a daemon thread; chat()/stream() are the sync facade.
+    """
+
+    def __init__(self, base_url="http://localhost:11434", max_concurrency=2, max_connections=4,
+                 timeout=30.0, retries=2, backoff=0.5):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.stats = {"requests": 0, "http_calls": 0, "coalesced": 0, "retries": 0,
+                      "errors": 0, "client_seconds": 0.0}
+        self._inflight = {}
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        # Created on the loop so they bind to it
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+        )
+        self._ready.set()
+        self._loop.run_forever()
+
+    @staticmethod
+    def _request_key(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _retry_delay(self, attempt):
+        return self.backoff * (2 ** attempt)
+
+    def _attempt_timeout(self, give_up):
+        """httpx timeout for one attempt: the client default, capped at the time left."""
+        remaining = give_up - self._loop.time()
+        if remaining <= 0:
+            raise TimeoutError("LLM request exceeded its deadline")
+        return httpx.Timeout(min(self.timeout, remaining), connect=min(5.0, remaining))
+
+    async def _post_with_retries(self, payload, entry):
+        """
+        One logical request: semaphore slot + retries, bounded by entry["give_up"] (the latest
+        deadline among its callers). Raises ConnectionError if Ollama is down.
+        """
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                timeout = self._attempt_timeout(entry["give_up"])
+                try:
+                    self.stats["http_calls"] += 1
+                    response = await self._client.post("/api/chat", json=payload, timeout=timeout)
+                    if response.status_code < 500:
+                        response.raise_for_status()
+                        return response.json()
+                    error = httpx.HTTPStatusError(f"Ollama returned {response.status_code}",
+                                                  request=response.request, response=response)
+                except httpx.TransportError as e:
+                    error = e
+            # Back off outside the semaphore so waiting requests can use the slot
+            if attempt < self.retries and self._loop.time() + self._retry_delay(attempt) < entry["give_up"]:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._retry_delay(attempt))
+            else:
+                break
+        if isinstance(error, httpx.ConnectError):
+            raise ConnectionError(str(error)) from error
+        raise error
+
+    async def achat(self, payload, deadline=None):
+        """Non-streaming chat request. Returns the decoded Ollama response."""
+        self.stats["requests"] += 1
+        timeout = deadline or self.timeout
+        give_up = self._loop.time() + timeout
+        key = self._request_key(payload)
+        entry = self._inflight.get(key)
+        if entry is None or entry["task"].done():
+            entry = {"waiters": 0, "give_up": give_up}
+            entry["task"] = asyncio.ensure_future(self._post_with_retries(payload, entry))
+            self._inflight[key] = entry
+            entry["task"].add_done_callback(
+                lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is entry else None)
+        else:
+            self.stats["coalesced"] += 1
+            entry["give_up"] = max(entry["give_up"], give_up)
+        # Shielded so one caller hitting its deadline doesn't cancel the request for the others;
+        # the last caller to leave cancels it, which frees its semaphore slot
+        entry["waiters"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry["task"]), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"LLM request exceeded its {timeout:g}s deadline")
+        finally:
+            entry["waiters"] -= 1
+            if not entry["waiters"] and not entry["task"].done():
+                entry["task"].cancel()
+
+    async def astream(self, payload, deadline=None):
+        """Streaming chat request. Yields decoded NDJSON chunks. Never coalesced."""
+        self.stats["requests"] += 1
+        give_up = self._loop.time() + (deadline or self.timeout)
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                async with self._semaphore:
+                    self.stats["http_calls"] += 1
+                    async with self._client.stream("POST", "/api/chat", json=payload,
+                                                   timeout=self._attempt_timeout(give_up)) as response:
+                        if response.status_code < 500:
+                            response.raise_for_status()
+                            lines = response.aiter_lines()
+                            while True:
+                                # Bound the wait for every line, so a server that stalls mid-reply still times out
+                                try:
+                                    line = await asyncio.wait_for(lines.__anext__(), max(0.0, give_up - self._loop.time()))
+                                except StopAsyncIteration:
+                                    return
+                                except asyncio.TimeoutError:
+                                    raise TimeoutError("LLM stream exceeded its deadline")
+                                if line:
+                                    started = True
+                                    yield json.loads(line)
+                        error = httpx.HTTPStatusError(f"Ollama returned {response.status_code}",
+                                                      request=response.request, response=response)
+            except httpx.TransportError as e:
+                if started:
+                    raise # Part of the reply is already out; a retry would repeat it
+                error = e
+            if attempt < self.retries and self._loop.time() + self._retry_delay(attempt) < give_up:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._retry_delay(attempt))
+            else:
+                break
+        if isinstance(error, httpx.ConnectError):
+            raise ConnectionError(str(error)) from error
+        raise error
+
+    def chat(self, payload, deadline=None):
+        """Sync facade over achat() for the assistant's worker threads."""
+        start = time.perf_counter()
+        try:
+            return asyncio.run_coroutine_threadsafe(self.achat(payload, deadline), self._loop).result()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["client_seconds"] += time.perf_counter() - start
+
+    def stream(self, payload, deadline=None):
+        """Sync facade over astream(): yields chunks on the calling thread as they arrive."""
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(payload, deadline):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        start = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    self.stats["errors"] += 1
+                    raise item
+                yield item
+        finally:
+            future.cancel() # Caller stopped early: release the connection and semaphore slot
+            self.stats["client_seconds"] += time.perf_counter() - start
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['requests']} requests, {s['http_calls']} calls, {s['coalesced']} coalesced, "
+                f"{s['retries']} retries, {s['errors']} errors")
+
+    def close(self):
+        async def shutdown():
+            await self._client.aclose()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
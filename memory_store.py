@@ -0,0 +1,210 @@
+import re
+import time
+import sqlite3
+import threading
+from collections import deque
+
+ARTIFACT_PATTERN = re.compile(r"\|\|SCREENSHOT:(.+?)\|\|")
+
+
+class Turn:
+    """
+    One user/assistant exchange, as kept in the in-process conversation window.
+    artifacts: file paths the reply produced (screenshots, camera captures).
+    """
+
+    def __init__(self, user, assistant, intent=None, artifacts=None, timestamp=None):
+        self.user = user or ""
+        self.assistant = assistant or ""
+        self.intent = intent
+        self.artifacts = tuple(artifacts) if artifacts is not None else tuple(ARTIFACT_PATTERN.findall(self.assistant))
+        self.timestamp = timestamp or time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()) # Same format as SQLite's CURRENT_TIMESTAMP
+
+    @property
+    def has_visual(self):
+        """True if this turn produced or announced a screenshot/photo."""
+        return bool(self.artifacts) or "Screenshot taken" in self.assistant or "Photo caught" in self.assistant
+
+    def as_dict(self):
+        """The dict shape load_history() returns."""
+        return {"user": self.user, "assistant": self.assistant, "timestamp": self.timestamp, "intent": self.intent}
+
+
+class ConversationWindow:
+    """
+    Bounded, thread-safe window of the most recent turns, oldest first.
+    save_history() appends to it as turns happen; the database is only read to
+    seed it at startup, so turns from before a restart are still there.
+    """
+
+    def __init__(self, maxlen=20):
+        self._turns = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def seed(self, turns):
+        """Replace the window with turns loaded from the database (oldest first)."""
+        with self._lock:
+            self._turns.clear()
+            self._turns.extend(turns)
+
+    def append(self, turn):
+        with self._lock:
+            self._turns.append(turn)
+
+    def recent(self, limit):
+        with self._lock:
+            return list(self._turns)[-limit:] if limit > 0 else []
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+
+    def __len__(self):
+        return len(self._turns)
+
+
+SCHEMA = [
+    # History table for raw transcripts
+    '''
+    CREATE TABLE IF NOT EXISTS conversation_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_text TEXT,
+        assistant_text TEXT,
+        intent TEXT
+    )
+    ''',
+    # Memory table for extracted "facts" or key settings
+    '''
+    CREATE TABLE IF NOT EXISTS system_memory (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+# Fixed SQL text so sqlite3's per-connection statement cache reuses the prepared statements
+SQL_COUNT_HISTORY = "SELECT COUNT(*) FROM conversation_history"
+SQL_RECENT_HISTORY = ("SELECT user_text, assistant_text, timestamp, intent FROM conversation_history "
+                      "ORDER BY timestamp DESC, id DESC LIMIT ?")
+SQL_INSERT_TURN = "INSERT INTO conversation_history (user_text, assistant_text, intent) VALUES (?, ?, ?)"
+SQL_IMPORT_TURN = "INSERT INTO conversation_history (timestamp, user_text, assistant_text) VALUES (?, ?, ?)"
+SQL_STORE_FACT = "INSERT OR REPLACE INTO system_memory (key, value) VALUES (?, ?)"
+SQL_SEARCH_FACTS = "SELECT key, value FROM system_memory WHERE key LIKE ? OR value LIKE ? ORDER BY updated_at DESC LIMIT ?"
+SQL_SEARCH_EPISODES = ("SELECT user_text, assistant_text, timestamp FROM conversation_history "
+                       "WHERE ({conditions}) ORDER BY timestamp DESC LIMIT ?")
+
+
+class MemoryStore:
+    """
+    Owns the SQLite connections for the memory database.
+    - One connection per thread (voice loop, Telegram workers, agent loop), opened once
+      and reused, so no per-call connect/close. Connections of threads that have exited
+      are closed whenever a new one is opened, and by close().
+    - WAL journal: readers never block the writer and vice versa.
+    - synchronous=NORMAL (safe with WAL), an 8 MB page cache and a busy timeout
+      instead of immediate "database is locked" errors.
+    - Writes go through one lock and an IMMEDIATE transaction, so they are serialized
+      in process and take the write lock up front rather than mid-transaction.
+    """
+    MAX_KEYWORDS = 8 # Bounds the number of distinct episodic-search statements
+
+    def __init__(self, db_path, cache_kib=8192, busy_timeout_ms=5000):
+        self.db_path = db_path
+        self.cache_kib = cache_kib
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._connections = {} # thread -> its connection
+        self._connections_lock = threading.Lock()
+
+    def connection(self):
+        """This thread's connection, opened and configured on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly in write()
+            conn = sqlite3.connect(self.db_path, isolation_level=None, cached_statements=64,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{int(self.cache_kib)}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._prune()
+                self._connections[threading.current_thread()] = conn
+        return conn
+
+    def _prune(self):
+        """Close connections left behind by finished threads (STT, executor, Telegram workers)."""
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            try:
+                self._connections.pop(thread).close()
+            except Exception:
+                pass
+
+    def read(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def write(self, statements):
+        """Run [(sql, params), ...] as one serialized transaction."""
+        conn = self.connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def init_schema(self):
+        self.write([(sql, ()) for sql in SCHEMA])
+
+    def history_count(self):
+        return self.read(SQL_COUNT_HISTORY)[0][0]
+
+    def recent_history(self, limit):
+        """Newest `limit` rows, oldest first: (user_text, assistant_text, timestamp, intent)."""
+        return list(reversed(self.read(SQL_RECENT_HISTORY, (limit,))))
+
+    def save_turn(self, user_text, assistant_text, intent=None):
+        self.write([(SQL_INSERT_TURN, (user_text, assistant_text, intent))])
+
+    def import_turns(self, entries):
+        """Bulk insert (timestamp, user_text, assistant_text) rows in one transaction."""
+        self.write([(SQL_IMPORT_TURN, entry) for entry in entries])
+
+    def store_fact(self, key, value):
+        self.write([(SQL_STORE_FACT, (key, value))])
+
+    def search_facts(self, query, limit):
+        pattern = f"%{query}%"
+        return self.read(SQL_SEARCH_FACTS, (pattern, pattern, limit))
+
+    def search_episodes(self, keywords, limit):
+        keywords = keywords[:self.MAX_KEYWORDS]
+        if not keywords:
+            return []
+        conditions = " OR ".join(["user_text LIKE ? OR assistant_text LIKE ?"] * len(keywords))
+        params = []
+        for k in keywords:
+            params.extend([f"%{k}%", f"%{k}%"])
+        params.append(limit)
+        return self.read(SQL_SEARCH_EPISODES.format(conditions=conditions), tuple(params))
+
+    def clear(self):
+        self.write([("DELETE FROM conversation_history", ()), ("DELETE FROM system_memory", ())])
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections.values():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
@@ -0,0 +1,474 @@
+import os
+import re
+import time
+import zlib
+import heapq
+import queue
+import hashlib
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+
+
+class PlaybackSink:
+    """
+    Long-lived PCM output stream for synthesized speech.
+    The PyAudio stream is opened once and reused for every utterance, so there is
+    no per-sentence process spawn or device open. interrupt() cuts playback within
+    one buffer period; if the device still has audio queued, the stream is closed to
+    discard it and reopened by the next write().
+    """
+
+    def __init__(self, pa, sample_rate=22050, frames_per_buffer=1024):
+        self.pa = pa
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.stream = None
+        self.generation = 0 # Bumped by interrupt(); writers holding an older value stop
+        self.queued_until = 0.0 # Monotonic time the device finishes playing what it was handed
+        self._lock = threading.Lock()
+        # (monotonic time, rms) per written slice: the echo reference for barge-in detection
+        self.level_history = deque(maxlen=256)
+
+    def _ensure_stream(self):
+        if self.stream is None:
+            self.stream = self.pa.open(
+                format=self.pa.get_format_from_width(2), channels=1, rate=self.sample_rate,
+                output=True, frames_per_buffer=self.frames_per_buffer,
+            )
+        return self.stream
+
+    def write(self, pcm, generation=None):
+        """
+        Play int16 PCM, blocking until it has been handed to the device.
+        Writes in buffer-sized slices and returns False as soon as the sink is interrupted.
+        """
+        if generation is None:
+            generation = self.generation
+        view = memoryview(pcm).cast("B")
+        step = self.frames_per_buffer * 2
+
+        with self._lock:
+            if self.generation != generation:
+                return False # Interrupted while waiting for the previous writer
+            stream = self._ensure_stream()
+            for offset in range(0, len(view), step):
+                if self.generation != generation:
+                    return False
+                piece = view[offset:offset + step]
+                samples = np.frombuffer(piece, dtype=np.int16).astype(np.float32)
+                level = float(np.sqrt(np.dot(samples, samples) / samples.size)) if samples.size else 0.0
+                now = time.monotonic()
+                self.level_history.append((now, level))
+                stream.write(piece)
+                self.queued_until = max(self.queued_until, now) + len(piece) / 2 / self.sample_rate
+        return self.generation == generation
+
+    def recent_level(self, window=0.4):
+        """Peak RMS of the PCM handed to the device in the last `window` seconds."""
+        cutoff = time.monotonic() - window
+        return max((level for t, level in list(self.level_history) if t >= cutoff), default=0.0)
+
+    def interrupt(self):
+        """
+        Stop whatever is playing, including audio already queued in the device.
+        Waits for the in-flight buffer write (one buffer period at most); the stream is
+        only torn down if it still has audio to play, so idle interrupts cost nothing.
+        """
+        self.generation += 1
+        with self._lock:
+            if self.stream and time.monotonic() < self.queued_until:
+                # PyAudio has no public abort; closing discards the pending buffers
+                self._close_stream()
+            self.queued_until = 0.0
+
+    def _close_stream(self):
+        try:
+            self.stream.close()
+        except Exception:
+            pass
+        self.stream = None
+
+    def close(self):
+        self.generation += 1
+        with self._lock:
+            if self.stream:
+                try:
+                    self.stream.stop_stream()
+                except Exception:
+                    pass
+                self._close_stream()
+
+
+PRIORITY_ALERT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class SpeechScheduler:
+    """
+    Event-driven priority queue for utterances.
+    Lower priority numbers are spoken first (FIFO within a level), identical pending
+    phrases are merged, and items past their deadline are dropped instead of spoken.
+    Consumers block on a condition variable, so an idle queue costs nothing.
+    """
+
+    def __init__(self, default_ttl=30.0):
+        self.default_ttl = default_ttl
+        self._heap = []
+        self._pending = {} # text -> heap entry, for dedupe
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.stats = {"queued": 0, "spoken": 0, "deduped": 0, "expired": 0, "max_depth": 0,
+                      "total_wait": 0.0, "max_wait": 0.0}
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def put(self, text, priority=PRIORITY_NORMAL, ttl=-1):
+        """
+        Queue text. ttl=-1 uses the default deadline; ttl=None never expires.
+        Returns False if an identical phrase was already pending.
+        """
+        if ttl == -1:
+            ttl = self.default_ttl
+        now = time.monotonic()
+        deadline = now + ttl if ttl is not None else None
+
+        with self._cond:
+            existing = self._pending.get(text)
+            if existing is not None:
+                self.stats["deduped"] += 1
+                if priority >= existing[0]:
+                    return False
+                # Same phrase at a more urgent level: re-file it
+                existing[-1] = False
+                now = existing[3]
+
+            self._seq += 1
+            entry = [priority, self._seq, text, now, deadline, True]
+            heapq.heappush(self._heap, entry)
+            self._pending[text] = entry
+            self.stats["queued"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._pending))
+            self._cond.notify()
+            return existing is None
+
+    def get(self, timeout=None):
+        """
+        Block until a live item is available. Returns its text, or None on timeout.
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                while self._heap:
+                    priority, _, text, queued_at, deadline, valid = heapq.heappop(self._heap)
+                    if not valid:
+                        continue
+                    del self._pending[text]
+                    now = time.monotonic()
+                    if deadline is not None and now > deadline:
+                        self.stats["expired"] += 1
+                        continue
+                    wait = now - queued_at
+                    self.stats["spoken"] += 1
+                    self.stats["total_wait"] += wait
+                    self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+                    return text
+
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def clear(self):
+        with self._cond:
+            self._heap.clear()
+            self._pending.clear()
+
+    def summary(self):
+        s = self.stats
+        avg_wait = (s["total_wait"] / s["spoken"] * 1000) if s["spoken"] else 0.0
+        return (f"depth {len(self)} (max {s['max_depth']}), avg wait {avg_wait:.0f}ms, "
+                f"max wait {s['max_wait'] * 1000:.0f}ms, {s['deduped']} deduped, {s['expired']} expired")
+
+
+def split_sentences(text, max_clause_length=120):
+    """
+    Split text into speakable segments: sentences, with over-long sentences
+    broken further at clause punctuation.
+    """
+    segments = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        if len(sentence) <= max_clause_length:
+            segments.append(sentence)
+            continue
+        current = ""
+        for clause in re.split(r"(?<=[,;:])\s+", sentence):
+            if current and len(current) + len(clause) + 1 > max_clause_length:
+                segments.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}" if current else clause
+        if current:
+            segments.append(current)
+    return [s for s in segments if s.strip()]
+
+
+class SpeechStream:
+    """
+    One reply that is still being generated, spoken as a single pipeline session.
+    The producer feeds sentences as they arrive and closes the stream at the end; the
+    pipeline keeps synthesizing ahead across sentence boundaries. Bound to the sink
+    generation it was opened in, so an interrupt ends it.
+    """
+
+    def __init__(self, generation=0):
+        self.generation = generation
+        self._segments = queue.Queue()
+
+    def feed(self, text):
+        for segment in split_sentences(text):
+            self._segments.put(segment)
+
+    def close(self):
+        self._segments.put(None)
+
+    def segments(self, sink):
+        """Yield segments until the stream is closed or the sink is interrupted."""
+        while sink.generation == self.generation:
+            try:
+                segment = self._segments.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if segment is None or sink.generation != self.generation:
+                return
+            yield segment
+
+
+class SpeechPipeline:
+    """
+    Overlaps synthesis with playback for multi-sentence replies.
+    A synthesis thread renders segments into a bounded queue (`lookahead` chunks
+    ahead) while the caller's thread plays them, so the listener only waits for
+    the first sentence. Interrupting the sink cancels both stages.
+    """
+
+    def __init__(self, synthesize, sink, lookahead=2):
+        self.synthesize = synthesize # fn(segment_text) -> iterable of PCM bytes
+        self.sink = sink
+        self.lookahead = lookahead
+
+    def _put(self, q, item, generation):
+        while self.sink.generation == generation:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, segments, q, generation):
+        try:
+            for segment in segments:
+                for pcm in self.synthesize(segment):
+                    if not self._put(q, pcm, generation):
+                        return
+        except Exception as e:
+            print(f"[jarvis] Speech synthesis error: {e}")
+        finally:
+            self._put(q, None, generation)
+
+    def speak(self, text, generation=None):
+        """
+        Speak `text` (a string or a SpeechStream), blocking until it has played or the
+        sink is interrupted. Returns True if the whole text was played.
+        """
+        if isinstance(text, SpeechStream):
+            generation = text.generation
+            segments = text.segments(self.sink)
+        else:
+            if generation is None:
+                generation = self.sink.generation
+            segments = split_sentences(text)
+            if not segments:
+                return True
+
+        q = queue.Queue(maxsize=self.lookahead)
+        producer = threading.Thread(target=self._produce, args=(segments, q, generation), daemon=True)
+        producer.start()
+
+        while True:
+            try:
+                pcm = q.get(timeout=0.1)
+            except queue.Empty:
+                if self.sink.generation != generation:
+                    return False
+                continue
+            if pcm is None:
+                return self.sink.generation == generation
+            if not self.sink.write(pcm, generation):
+                return False
+
+
+class SpeechCache:
+    """
+    Two-tier cache of synthesized PCM keyed by text + voice configuration.
+    Memory tier is an LRU bounded by bytes; the optional disk tier stores raw
+    (or zlib-compressed) int16 files and evicts the least recently used once
+    it grows past its cap. Only phrases requested at least `persist_after` times
+    are written to disk, so one-off LLM sentences never touch it.
+    """
+
+    def __init__(self, memory_max_bytes=32 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=200 * 1024 * 1024, compress=True, max_text_length=200,
+                 persist_after=2, max_tracked=4096):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.compress = compress
+        self.max_text_length = max_text_length # Long LLM replies rarely repeat; don't bother
+        self.persist_after = persist_after
+        self.max_tracked = max_tracked # Bounds the per-key request counts
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._requests = OrderedDict() # key -> times requested, most recent last
+        self._disk_bytes = 0 # Running total; the directory is only rescanned when trimming
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "persisted": 0}
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+            except OSError as e:
+                print(f"[jarvis] Speech cache disk tier disabled: {e}")
+                self.disk_dir = None
+
+    def key(self, text, voice_id):
+        return hashlib.sha1(f"{voice_id}\x00{text.strip()}".encode("utf-8")).hexdigest()
+
+    def cacheable(self, text):
+        return len(text) <= self.max_text_length
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + (".pcm.z" if self.compress else ".pcm"))
+
+    def _note_request(self, key):
+        """Count a lookup of key; returns how many times it has been requested."""
+        with self._lock:
+            count = self._requests.pop(key, 0) + 1
+            self._requests[key] = count
+            if len(self._requests) > self.max_tracked:
+                self._requests.popitem(last=False)
+            return count
+
+    def get(self, key):
+        """Return cached PCM bytes or None."""
+        requests = self._note_request(key)
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+        if pcm is not None:
+            # Phrase just turned out to recur: keep it across restarts
+            if self.disk_dir and requests == self.persist_after:
+                self._persist(key, pcm)
+            return pcm
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                pcm = zlib.decompress(data) if self.compress else data
+                os.utime(path) # Mark as recently used for eviction
+                self._remember(key, pcm)
+                self.stats["disk_hits"] += 1
+                return pcm
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"[jarvis] Speech cache read error: {e}")
+                self._discard(path) # Unreadable: drop it so the phrase can be persisted again
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, pcm):
+        self._remember(key, pcm)
+        self.stats["stores"] += 1
+        # Re-synthesized after falling out of memory: it recurs, so it goes to disk too
+        if self.disk_dir and self._requests.get(key, 0) >= self.persist_after:
+            self._persist(key, pcm)
+
+    def _persist(self, key, pcm):
+        try:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                return # Already on disk (e.g. loaded from there after a restart); same key, same audio
+            tmp_path = path + ".tmp"
+            data = zlib.compress(pcm, 6) if self.compress else pcm
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.stats["persisted"] += 1
+            with self._lock:
+                self._disk_bytes += len(data)
+                over = self._disk_bytes > self.disk_max_bytes
+            if over:
+                self._trim_disk()
+        except Exception as e:
+            print(f"[jarvis] Speech cache write error: {e}")
+
+    def _discard(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _remember(self, key, pcm):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = pcm
+            self._memory_bytes += len(pcm)
+            while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _scan_disk(self):
+        """(mtime, size, path) for every cache file."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.startswith(".") and name.endswith((".pcm", ".pcm.z")):
+                path = os.path.join(self.disk_dir, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _trim_disk(self):
+        """Evict least recently used files down to 90% of the cap, so trims stay infrequent."""
+        entries = self._scan_disk()
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            os.remove(path)
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def summary(self):
+        s = self.stats
+        hits = s["memory_hits"] + s["disk_hits"]
+        lookups = hits + s["misses"]
+        rate = (hits / lookups * 100) if lookups else 0.0
+        return f"{hits} hits ({s['memory_hits']} memory, {s['disk_hits']} disk) / {s['misses']} misses, {rate:.0f}% hit rate"
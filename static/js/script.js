@@ -32,11 +32,11 @@ setInterval(updateTime, 1000);
 updateTime();
 
 // Helper to add logs
-function addLog(text, type = 'system') {
+function addLog(text, type = 'system', force = false) {
     if (!terminalContent) return;
 
     // Check if duplicate to avoid spam
-    if (terminalContent.lastChild && terminalContent.lastChild.textContent.includes(text)) {
+    if (!force && terminalContent.lastChild && terminalContent.lastChild.textContent.includes(text)) {
         return;
     }
 
@@ -316,7 +316,28 @@ socket.on('status_update', (data) => {
     }
 });
 
+// Streamed replies: one log line per stream_id, extended as tokens arrive
+const streamEntries = {};
+
+function appendLogDelta(streamId, delta, type = 'system') {
+    if (!terminalContent) return;
+
+    let span = streamEntries[streamId];
+    if (!span || !span.isConnected) {
+        addLog('', type, true);
+        span = terminalContent.lastChild.lastChild;
+        streamEntries[streamId] = span;
+    }
+    span.textContent += delta;
+    terminalContent.scrollTop = terminalContent.scrollHeight;
+}
+
 socket.on('new_log', (data) => {
+    if (data.stream_id) {
+        if (data.message) appendLogDelta(data.stream_id, data.message, data.type || 'system');
+        if (data.stream_end) delete streamEntries[data.stream_id];
+        return;
+    }
     addLog(data.message, data.type || 'system');
 });
 